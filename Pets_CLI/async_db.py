@@ -0,0 +1,204 @@
+import asyncio  # ? asyncio to await the queries
+import queue  # ? to queue the writes for the writer thread
+import threading  # ? to run the writer thread
+import functools  # ? to pass keyword arguments to the executor
+from concurrent.futures import ThreadPoolExecutor  # ? to run the reads
+import db_manager  # ? to query the database
+
+# ? This module provides an asyncio API over db_manager for async services.
+# * The blocking sqlite3 calls never run on the event loop:
+# * - Reads run on a pool of reader threads, each with its own pooled connection, so under
+# *   WAL they run concurrently with each other and with the writer.
+# * - Writes are queued to one writer thread, which serializes them and coalesces the
+# *   writes waiting in the queue into a single transaction.
+# * - The number of pending reads and writes is bounded, callers wait for a free slot.
+# * The module functions (`aget_pets`, `acreate_pet`, ...) use a default AsyncDB created
+# * on first use.
+
+READERS = 4
+
+MAX_PENDING = 1000
+
+MAX_BATCH = 500
+
+
+# ? Async Database
+# * This class runs db_manager functions from async code.
+# ! @param readers - The number of reader threads.
+# ! @param max_pending - The max number of reads (and of writes) waiting to run.
+# ! @param max_batch - The max number of writes committed in one transaction.
+# * - `read(fn, *args, **kwargs)` runs a db_manager read function on a reader thread.
+# * - `write(fn, *args, **kwargs)` queues a db_manager write function for the writer thread.
+# * - The writer takes every queued write (up to `max_batch`), runs each one inside a
+# *   SAVEPOINT of one transaction and commits once. If a write fails only its savepoint
+# *   is rolled back and its caller gets the exception, the rest of the batch is committed.
+# * - `close()` waits for the queued writes and stops the threads.
+
+class AsyncDB:
+
+    def __init__(self, readers=READERS, max_pending=MAX_PENDING, max_batch=MAX_BATCH):
+        self.max_batch = max_batch
+        self._readers = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="db-reader")
+        self._read_slots = asyncio.Semaphore(max_pending)
+        self._write_slots = asyncio.Semaphore(max_pending)
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="db-writer", daemon=True)
+        self._writer.start()
+
+    async def read(self, fn, *args, **kwargs):
+        async with self._read_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._readers, functools.partial(fn, *args, **kwargs))
+
+    async def write(self, fn, *args, **kwargs):
+        async with self._write_slots:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._writes.put((functools.partial(fn, *args, **kwargs), loop, future))
+            return await future
+
+    async def close(self):
+        self._writes.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._writer.join)
+        self._readers.shutdown()
+
+    def _write_loop(self):
+
+        running = True
+
+        while running:
+
+            job = self._writes.get()
+            if job is None:
+                return
+
+            batch = [job]
+
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    running = False
+                    break
+                batch.append(job)
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+
+        results = []
+
+        try:
+            with db_manager.pool.connection() as con:
+
+                con.execute("BEGIN IMMEDIATE")
+
+                for job, loop, future in batch:
+
+                    con.execute("SAVEPOINT job")
+                    try:
+                        results.append((job(), None))
+                        con.execute("RELEASE job")
+                    except Exception as error:
+                        con.execute("ROLLBACK TO job")
+                        con.execute("RELEASE job")
+                        results.append((None, error))
+
+        except Exception as error:
+            results = [(None, error)] * len(batch)
+
+        for (job, loop, future), (result, error) in zip(batch, results):
+            loop.call_soon_threadsafe(settle, future, result, error)
+
+
+# ? Settle Future
+# * This function sets the result or the exception of a future, unless it was cancelled.
+# * It runs on the event loop of the future, called with `call_soon_threadsafe()`.
+
+def settle(future, result, error):
+
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+# ? Default Instance
+# * `get_db()` returns the AsyncDB used by the module functions, created on first use.
+# * `close()` closes it, the next call creates a new one.
+
+_db = None
+
+
+def get_db():
+
+    global _db
+
+    if _db is None:
+        _db = AsyncDB()
+    return _db
+
+
+async def close():
+
+    global _db
+
+    if _db is not None:
+        db, _db = _db, None
+        await db.close()
+
+
+# ? Async Functions
+# * Each function awaits the db_manager function with the same name (without the 'a'),
+# * reads run on the reader threads and writes on the writer thread.
+
+def reader(fn):
+
+    async def run(*args, **kwargs):
+        return await get_db().read(fn, *args, **kwargs)
+
+    run.__name__ = f"a{fn.__name__}"
+    return run
+
+
+def writer(fn):
+
+    async def run(*args, **kwargs):
+        return await get_db().write(fn, *args, **kwargs)
+
+    run.__name__ = f"a{fn.__name__}"
+    return run
+
+
+aget_users = reader(db_manager.get_users)
+aget_user = reader(db_manager.get_user)
+ausers_by_ids = reader(db_manager.users_by_ids)
+auser_pets = reader(db_manager.user_pets)
+auser_with_pets = reader(db_manager.user_with_pets)
+aget_pets = reader(db_manager.get_pets)
+aget_pet = reader(db_manager.get_pet)
+aview_categorys = reader(db_manager.view_categorys)
+aget_category = reader(db_manager.get_category)
+acategory_pets = reader(db_manager.category_pets)
+asearch_users = reader(db_manager.search_users)
+asearch_pets = reader(db_manager.search_pets)
+asearch_categorys = reader(db_manager.search_categorys)
+
+anew_user = writer(db_manager.new_user)
+aupdate_user = writer(db_manager.update_user)
+adelete_user = writer(db_manager.delete_user)
+acreate_pet = writer(db_manager.create_pet)
+acreate_pet_for_owner = writer(db_manager.create_pet_for_owner)
+aupdate_pet = writer(db_manager.update_pet)
+adelete_pet = writer(db_manager.delete_pet)
+acreate_category = writer(db_manager.create_category)
+adelete_category = writer(db_manager.delete_category)
+adelete_many = writer(db_manager.delete_many)
+aupdate_many = writer(db_manager.update_many)
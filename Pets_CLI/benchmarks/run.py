@@ -0,0 +1,275 @@
+import click  # ? click library to manage the benchmark options
+import json  # ? to save and load the results
+import os  # ? to manage the benchmark directory
+import platform  # ? to record the machine in the results
+import random  # ? to generate the synthetic dataset
+import sqlite3  # ? to record the SQLite version in the results
+import statistics  # ? to summarize the timings
+import subprocess  # ? to time the CLI startup
+import sys  # ? to find the project modules
+import tempfile  # ? to keep the benchmark database apart
+import time  # ? to time the functions
+from click.testing import CliRunner  # ? to run the CLI commands in process
+
+# ? This script benchmarks db_manager, the CLI commands and the exports on a synthetic dataset.
+# * - It creates a fresh database of the requested size in a temporary directory.
+# * - Every benchmark is run several times, the min, median and mean times are recorded.
+# * - The results are saved as JSON, '--compare' prints the ratios against an older run
+# *   and exits with an error if any benchmark got slower than the threshold.
+# * Usage: python benchmarks/run.py --users 10000 --pets 100000 --output results.json
+
+PROJECT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT)
+
+import db_manager  # noqa: E402
+import cli  # noqa: E402
+
+NAMES = ["Max", "Luna", "Rocky", "Bella", "Coco", "Simba", "Nala", "Toby"]
+LASTNAMES = ["Pérez", "Gómez", "Smith", "Rossi", "Silva", "Müller", "Chen"]
+
+
+# ? Generate Dataset
+# * This function fills the benchmark database with synthetic rows using `bulk_import()`.
+# ! @param users, pets, categorys - The number of rows of each table.
+# ! @param seed - The random seed, the same seed gives the same dataset.
+
+def generate(users, pets, categorys, seed):
+
+    rng = random.Random(seed)
+
+    db_manager.bulk_import("Categorys", (
+        {"Name": f"Category {i}"} for i in range(1, categorys + 1)))
+
+    db_manager.bulk_import("Users", (
+        {"Name": rng.choice(NAMES), "Lastname": rng.choice(LASTNAMES)}
+        for _ in range(users)))
+
+    db_manager.bulk_import("Pets", (
+        {"CategoryID": rng.randint(1, categorys), "Name": rng.choice(NAMES),
+         "Sex": rng.choice(["Male", "Female"]), "UserID": rng.randint(1, users),
+         "Age": rng.randint(0, 20)}
+        for _ in range(pets)))
+
+
+# ? Measure
+# * This function runs a benchmark several times and summarizes its timings in seconds.
+# ! @param fn - The function to time, called without arguments.
+# ! @param repeat - The number of runs.
+# ! @param setup - An optional function called before each run, it's not timed.
+
+def measure(fn, repeat, setup=None):
+
+    times = []
+
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    return {
+        "runs": repeat,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+    }
+
+
+# ? Benchmarks
+# * This function returns the benchmarks as a dictionary {name: (function, repeat, setup)}.
+# ! @param users, pets, categorys - The size of the dataset, to pick existing ids.
+# ! @param repeat - The number of runs of the quick benchmarks.
+# ! @param rng - The random generator used to pick ids.
+# * - 'db.*' benchmarks call db_manager with an empty query cache, 'cached.*' with a warm one.
+# * - 'cli.*' benchmarks run the click commands in process with `CliRunner`.
+# * - 'export.*' benchmarks write the Excel, PDF, Parquet and Arrow files, one by one and
+# *   with the parallel pipeline, 'export.excel_incremental' applies 100 changed pets to the
+# *   file of 'export.excel', 'backup.*' the plain and gzip backups, they run only once.
+
+def benchmarks(users, pets, categorys, repeat, rng):
+
+    runner = CliRunner()
+    cold = db_manager.cache.clear
+
+    def user_id():
+        return rng.randint(1, users)
+
+    def pet_id():
+        return rng.randint(1, pets)
+
+    def category_id():
+        return rng.randint(1, categorys)
+
+    # * the changes written before the incremental Excel export, not timed
+    def change_pets():
+        db_manager.update_many("Pets", {"Age": 1}, ids=[pet_id() for _ in range(100)])
+
+    def command(*args):
+        def run():
+            result = runner.invoke(cli.cli, [str(arg) for arg in args])
+            if result.exception:
+                raise result.exception
+        return run
+
+    return {
+        "db.get_users": (db_manager.get_users, repeat, cold),
+        "db.get_user": (lambda: db_manager.get_user(user_id()), repeat, cold),
+        "db.users_by_ids": (lambda: db_manager.users_by_ids(
+            [user_id() for _ in range(100)]), repeat, cold),
+        "db.user_pets": (lambda: db_manager.user_pets(user_id()), repeat, cold),
+        "db.user_with_pets": (lambda: db_manager.user_with_pets(user_id()), repeat, cold),
+        "db.get_pets": (db_manager.get_pets, repeat, cold),
+        "db.get_pets_page": (lambda: db_manager.get_pets(
+            100, None, pet_id()), repeat, cold),
+        "db.load_pets": (lambda: db_manager.load_listing("pets"), repeat, None),
+        "db.get_pet": (lambda: db_manager.get_pet(pet_id()), repeat, cold),
+        "db.view_categorys": (db_manager.view_categorys, repeat, cold),
+        "db.category_pets": (lambda: db_manager.category_pets(
+            category_id()), repeat, cold),
+        "db.get_category": (lambda: db_manager.get_category(
+            category_id()), repeat, cold),
+        "db.new_user": (lambda: db_manager.new_user("Bench", "Mark"), repeat, None),
+        "db.update_user": (lambda: db_manager.update_user(
+            user_id(), "Bench", "Mark"), repeat, None),
+        "db.create_pet": (lambda: db_manager.create_pet(
+            user_id(), category_id(), "Bench", "Male", 1), repeat, None),
+        "db.update_pet": (lambda: db_manager.update_pet(
+            pet_id(), category_id(), "Bench", "Male", user_id(), 2), repeat, None),
+        "db.create_category": (lambda: db_manager.create_category("Bench"), repeat, None),
+        "db.search_users": (lambda: db_manager.search_users(
+            rng.choice(LASTNAMES)[:2]), repeat, cold),
+        "db.search_pets": (lambda: db_manager.search_pets(
+            rng.choice(NAMES), rng.choice(LASTNAMES)), repeat, cold),
+        "cached.get_pets": (db_manager.get_pets, repeat, None),
+        "cached.view_categorys": (db_manager.view_categorys, repeat, None),
+        "cli.users": (command("users", "--limit", 100), repeat, None),
+        "cli.searchUser": (lambda: command("searchuser", user_id())(), repeat, None),
+        "cli.pets": (lambda: command("pets", user_id())(), repeat, None),
+        "cli.petList": (command("petlist", "--format", "csv"), 1, cold),
+        "cli.categorys": (command("categorys"), repeat, cold),
+        "cli.petsCategory": (lambda: command(
+            "petscategory", category_id(), "--limit", 100)(), repeat, cold),
+        "cli.newUser": (command("newuser", "--name", "Bench", "--lastname", "Mark"), repeat, None),
+        "cli.newPet": (lambda: command("newpet", user_id(), "--category", category_id(),
+                                       "--name", "Bench", "--sex", "Male", "--age", 1)(), repeat, None),
+        "cli.updatePet": (lambda: command("updatepet", pet_id(), "--age", 3)(), repeat, None),
+        "export.excel": (db_manager.export_excel, 1, None),
+        "export.excel_incremental": (lambda: db_manager.export_excel(
+            incremental=True), 1, change_pets),
+        "export.pdf": (db_manager.export_pdf, 1, None),
+        "export.parquet": (lambda: db_manager.export_columnar(fmt="parquet"), 1, None),
+        "export.arrow": (lambda: db_manager.export_columnar(fmt="arrow"), 1, None),
+        "export.all": (db_manager.export_all, 1, None),
+        "backup.plain": (lambda: db_manager.backup_db("backups/data.db"), 1, None),
+        "backup.gzip": (lambda: db_manager.backup_db("backups/data.db.gz", "gzip"), 1, None),
+    }
+
+
+# ? CLI Startup
+# * This function times a whole CLI process, imports included, for a command that
+# * doesn't load pandas, openpyxl or reportlab.
+
+def startup(repeat):
+
+    args = [sys.executable, os.path.join(PROJECT, "cli.py"), "searchuser", "1"]
+    return measure(lambda: subprocess.run(args, capture_output=True, check=True), repeat)
+
+
+# ? Compare Results
+# * This function prints the median of each benchmark against an older run.
+# ! @param old, new - The results of both runs.
+# ! @param threshold - The max accepted ratio new/old, e.g. 1.2 for 20% slower.
+# * - It returns the names of the benchmarks slower than the threshold.
+
+def compare(old, new, threshold):
+
+    slower = []
+
+    for name, result in new["results"].items():
+        before = old["results"].get(name)
+        if before is None:
+            print(f"{name:28} {result['median'] * 1000:10.2f} ms  (new)")
+            continue
+
+        ratio = result["median"] / before["median"] if before["median"] else 1.0
+        flag = ""
+        if ratio > threshold:
+            slower.append(name)
+            flag = "  SLOWER"
+        print(f"{name:28} {before['median'] * 1000:10.2f} ms -> "
+              f"{result['median'] * 1000:10.2f} ms  x{ratio:.2f}{flag}")
+
+    return slower
+
+
+@click.command()
+@click.option('--users', type=int, default=10000, show_default=True, help="Users in the dataset")
+@click.option('--pets', type=int, default=100000, show_default=True, help="Pets in the dataset")
+@click.option('--categorys', type=int, default=20, show_default=True, help="Categorys in the dataset")
+@click.option('--repeat', type=int, default=20, show_default=True, help="Runs of each quick benchmark")
+@click.option('--seed', type=int, default=42, show_default=True, help="Random seed of the dataset")
+@click.option('--only', help="Only run the benchmarks whose name starts with this prefix")
+@click.option('--output', type=click.Path(dir_okay=False), help="File to save the results as JSON")
+@click.option('--compare', 'baseline', type=click.File('r'), help="Older results to compare with")
+@click.option('--threshold', type=float, default=1.2, show_default=True, help="Max accepted slowdown ratio")
+def main(users, pets, categorys, repeat, seed, only, output, baseline, threshold):
+
+    if output:
+        output = os.path.abspath(output)
+
+    results = {}
+
+    with tempfile.TemporaryDirectory() as workdir:
+
+        os.chdir(workdir)
+        db_manager.configure(path=os.path.join(workdir, "data.db"))
+        db_manager.create_db()
+
+        start = time.perf_counter()
+        generate(users, pets, categorys, seed)
+        print(f"Dataset generated in {time.perf_counter() - start:.2f} s")
+
+        rng = random.Random(seed)
+
+        for name, (fn, runs, setup) in benchmarks(
+                users, pets, categorys, repeat, rng).items():
+            if only and not name.startswith(only):
+                continue
+            results[name] = measure(fn, runs, setup)
+            print(f"{name:28} {results[name]['median'] * 1000:10.2f} ms")
+
+        if not only or "startup".startswith(only):
+            results["startup"] = startup(min(repeat, 5))
+            print(f"{'startup':28} {results['startup']['median'] * 1000:10.2f} ms")
+
+        db_manager.pool.close()
+        os.chdir(PROJECT)
+
+    run = {
+        "meta": {
+            "users": users,
+            "pets": pets,
+            "categorys": categorys,
+            "seed": seed,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.platform(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(run, file, indent=2)
+        print(f"Results saved to {output}")
+
+    if baseline:
+        slower = compare(json.load(baseline), run, threshold)
+        if slower:
+            sys.exit(f"{len(slower)} benchmarks are slower than x{threshold}")
+
+
+if __name__ == '__main__':
+    main()
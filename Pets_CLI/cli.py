@@ -1,10 +1,18 @@
 import click  # ? click library to manage the CLI commands
 import db_manager  # ? to manage the database
-import pandas as pd  # ? to create dataframes
+import contextlib  # ? to capture the output of the shell commands
+import io  # ? to buffer the output and detach the stdin of the shell commands
+import json  # ? to write the shell results and the JSON output
+import csv  # ? to write the CSV output
+import os  # ? to manage the shell socket
+import shlex  # ? to split the shell command lines
+import sys  # ? to read the shell commands from stdin
+import time  # ? to time the export pipeline
 
 # ? This script provides a command-line interface (CLI) for managing users, pets, categories, and exports in a database.
 # * It utilizes the click library to define and handle CLI commands, and the db_manager module to interact with the database.
-# * The script also uses the pandas library to create dataframes for displaying data.
+# * The script also uses the pandas library to create dataframes for displaying data, it's only
+# * imported by `print_table()`, so commands that don't list data start faster.
 
 # ! create a group of commands
 # ? Command-Line Interface
@@ -13,38 +21,254 @@ import pandas as pd  # ? to create dataframes
 # * - It doesn't have any implementation and simply serves as a placeholder.
 # * - Additional commands can be added as subcommands using the `@cli.command()` decorator.
 # * - To execute the program, this function needs to be invoked.
+# * - Before any command but 'migrate', it checks the database with `open_database()`.
+# * - With '--readonly' (or '--immutable'), it opens the database read-only instead, see
+# *   `open_readonly()`, and only the commands of READONLY_COMMANDS can run.
 
 
 @click.group()
-def cli():
-    pass
+@click.option('--profile', type=click.Choice(['summary', 'json', 'trace'], case_sensitive=False), envvar='PETS_PROFILE', help="Record query and phase timings")
+@click.option('--profile-output', type=click.Path(dir_okay=False), envvar='PETS_PROFILE_OUTPUT', help="File for the profile, by default stderr")
+@click.option('--readonly', is_flag=True, envvar='PETS_READONLY', help="Open the database read-only, for reports")
+@click.option('--immutable', is_flag=True, envvar='PETS_IMMUTABLE', help="Read-only, for database files nobody writes (backups)")
+@click.pass_context
+def cli(ctx, profile, profile_output, readonly, immutable):
+    if profile:
+        start_profile(ctx, profile, profile_output)
+    if readonly or immutable or db_manager.pool.readonly:
+        open_readonly(ctx, immutable)
+    elif ctx.invoked_subcommand != 'migrate':
+        open_database(ctx.invoked_subcommand)
+
+
+# ? Open Database
+# * This function checks that the database is up to date before a command runs.
+# ! @param command - The name of the command.
+# * - A new database, without tables, is created with `db_manager.create_db()`.
+# * - An existing database with pending migrations is never migrated by the commands, since
+# *   a migration can take long on a big file: the command fails and asks for 'migrate'.
+# *   'repair' still runs, to remove the orphans that stop a migration.
+# * - On an up to date database it only reads the schema version, one query.
+
+def open_database(command):
+
+    if db_manager.schema_version() >= db_manager.MIGRATIONS[-1][0]:
+        return
+
+    if db_manager.is_new_db():
+        db_manager.create_db()
+    elif command != 'repair':
+        raise click.UsageError("The database has pending migrations, run 'migrate' first")
+
+
+# ? Read-Only Mode
+# * READONLY_COMMANDS are the commands that never write the database.
+# * `open_readonly()` switches the db_manager pool to read-only connections ('mode=ro' URI,
+# * large mmap_size) and checks that the command can run:
+# * - The database must exist and be migrated, since it can't be changed.
+# * - Other commands fail with a usage error instead of a SQLite write error.
+# * - In 'shell', the pool stays read-only for every command line.
+
+READONLY_COMMANDS = {'users', 'searchuser', 'search', 'pets', 'petlist', 'categorys',
+                     'petscategory', 'stats', 'exportpdf', 'exportparquet',
+                     'exportarrow', 'backup', 'shell'}
+
+
+def open_readonly(ctx, immutable):
+
+    command = ctx.invoked_subcommand
+
+    if command not in READONLY_COMMANDS:
+        raise click.UsageError(f"{command} writes the database, it can't run read-only")
+
+    if not db_manager.pool.readonly:
+        if not os.path.exists(db_manager.pool.path):
+            raise click.UsageError(f"The database {db_manager.pool.path} doesn't exist")
+        db_manager.configure(readonly=True, immutable=immutable)
+
+        if db_manager.schema_version() < db_manager.MIGRATIONS[-1][0]:
+            raise click.UsageError("The database has pending migrations, run 'migrate' first")
+
+
+# ? Start Profile
+# * This function turns on the db_manager profiler for the current command.
+# ! @param ctx - The click context of the group.
+# ! @param profile - 'summary' (text table), 'json' (raw events) or 'trace' (Chrome trace events).
+# ! @param output - The file where the profile is written, by default stderr.
+# * - When the command ends, the total time of the command is recorded as a phase and the
+# *   profile is written. Queries, connections, exports and output are timed by db_manager,
+# *   `print_table()` and `write_rows()`.
+
+def start_profile(ctx, profile, output):
+
+    profiler = db_manager.profiler
+    profiler.enable()
+
+    def report():
+        profiler.disable()
+
+        if profile == 'summary':
+            text = profiler.summary()
+        elif profile == 'json':
+            text = json.dumps(profiler.to_json(), indent=2)
+        else:
+            text = json.dumps(profiler.to_trace())
+
+        if output:
+            with open(output, 'w') as file:
+                file.write(text + "\n")
+        else:
+            click.echo(text, err=True)
+
+    # * close callbacks run in reverse order, so the command phase ends before the report
+    ctx.call_on_close(report)
+    ctx.with_resource(profiler.phase(f"command {ctx.invoked_subcommand}"))
+
+
+# ? Print Table
+# * This function prints rows as a pandas DataFrame.
+# ! @param rows - The rows to print, a list of tuples or a `ResultSet`.
+# ! @param columns - The column names.
+# * - pandas is imported here and not at the top of the script, because it takes most of
+# *   the startup time of the CLI.
+# * - A `ResultSet` is passed column by column, without building a tuple per row.
+
+def print_table(rows, columns):
+
+    with db_manager.profiler.phase("import pandas"):
+        import pandas as pd
+
+    with db_manager.profiler.phase("dataframe", rows=len(rows)):
+        if isinstance(rows, db_manager.ResultSet):
+            table = pd.DataFrame(
+                {column: rows[name] for column, name in zip(columns, rows.columns)})
+        else:
+            table = pd.DataFrame(rows, columns=columns)
+
+    with db_manager.profiler.phase("print"):
+        print(table)
+
+
+# ? Write Rows
+# * This function writes rows to stdout in a machine readable format while they are fetched.
+# ! @param rows - An iterable of rows, e.g. from `db_manager.stream_listing()`.
+# ! @param columns - The column names.
+# ! @param fmt - 'json', 'ndjson', 'csv', 'tsv' or 'arrow'.
+# * - 'json' writes one array of objects, 'ndjson' one object per line.
+# * - 'csv' and 'tsv' write a header line and one line per row.
+# * - 'arrow' writes an Arrow IPC stream to the binary stdout, it needs pyarrow.
+# * - Nothing is buffered besides one Arrow batch, so memory stays constant.
+# * - The output is timed as one profiler phase, the rows are read while it's written.
+
+def write_rows(rows, columns, fmt):
+
+    with db_manager.profiler.phase(f"output {fmt}"):
+        write_format(rows, columns, fmt)
+
+
+def write_format(rows, columns, fmt):
+
+    out = sys.stdout
+
+    if fmt in ('csv', 'tsv'):
+        writer = csv.writer(out, delimiter=',' if fmt == 'csv' else '\t',
+                            lineterminator='\n')
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+    elif fmt == 'ndjson':
+        for row in rows:
+            out.write(json.dumps(dict(zip(columns, row))) + "\n")
+
+    elif fmt == 'json':
+        out.write("[")
+        for position, row in enumerate(rows):
+            out.write(",\n" if position else "\n")
+            out.write(json.dumps(dict(zip(columns, row))))
+        out.write("\n]\n")
+
+    elif fmt == 'arrow':
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise click.UsageError("pyarrow is required for --format arrow")
+
+        binary = getattr(out, 'buffer', None)
+        if binary is None:
+            raise click.UsageError("--format arrow needs a binary stdout")
+
+        batches = db_manager.arrow_batches(rows, columns)
+        first = next(batches, None)
+        schema = first.schema if first is not None else pa.schema(
+            [(column, pa.null()) for column in columns])
+
+        out.flush()
+        with pa.ipc.new_stream(binary, schema) as writer:
+            if first is not None:
+                writer.write_batch(first)
+            for batch in batches:
+                writer.write_batch(batch)
+        binary.flush()
+
+
+# ? Format Option
+# * This decorator adds the '--format' option to a read command.
+# * - 'table' (the default) prints a DataFrame, the other formats are written by `write_rows()`.
+
+FORMATS = ['table', 'json', 'ndjson', 'csv', 'tsv', 'arrow']
+
+
+def format_option(command):
+
+    return click.option('--format', 'fmt', type=click.Choice(FORMATS, case_sensitive=False), default='table', show_default=True, help="Output format")(command)
+
+
+# ? Listing Options
+# * This decorator adds the pagination and streaming options to a listing command.
+# * - '--limit' and '--offset' select a page of rows.
+# * - '--after-id' only shows rows with a greater ID (keyset pagination, fast on big tables).
+# * - '--stream' prints the rows while they are fetched, as tab separated lines (like '--format tsv').
+# * - '--format' selects the output format, see `format_option()`.
+
+def listing_options(command):
+
+    command = format_option(command)
+    command = click.option('--stream', is_flag=True, help="Print rows while they are fetched")(command)
+    command = click.option('--after-id', type=int, help="Only rows with a greater ID")(command)
+    command = click.option('--offset', type=click.IntRange(min=0), help="Rows to skip")(command)
+    command = click.option('--limit', type=click.IntRange(min=0), help="Max number of rows")(command)
+    return command
 
 
 # ? get users -command
 # * This command retrieves users from the database and displays the information.
 # * If no users are found, it prints a message. Otherwise, it  prints the number of users and displays their details in a DataFrame.
+# * It accepts the pagination and streaming options of `listing_options()`.
 
 
 @cli.command()
-def users():
+@listing_options
+def users(limit, offset, after_id, stream, fmt):
+
+    if stream or fmt != 'table':
+        write_rows(db_manager.stream_listing(
+            "users", (), limit, offset, after_id), ['ID', 'Name', 'Lastname'], 'tsv' if fmt == 'table' else fmt)
+        return
 
-    users = db_manager.get_users()
+    users = db_manager.load_listing("users", (), limit, offset, after_id)
 
-    if users == []:
+    if len(users) == 0:
         print("No users found")
         return
 
     print(f"There are {len(users)} users")
-    users_df = pd.DataFrame(
-        users, columns=['ID', 'Name', 'Lastname'])
-    print(users_df)
+    print_table(users, ['ID', 'Name', 'Lastname'])
 
 
 # ? newUser - Command
 # * This command creates a new user with the provided name and lastname.
 # * - If the name or lastname is not provided, it raises an error.
-# * - After creating the user, it retrieves the updated list of users.
-# * - Finally, it prints the ID of the newly created user.
+# * - After creating the user, it prints its ID, returned by `db_manager.new_user()`.
 
 
 @cli.command()
@@ -60,23 +284,17 @@ def newUser(ctx, name, lastname):
             "Name": name,
             "Lastname": lastname
         }
-        # * create the user
-        db_manager.new_user(
+        # * create the user, its ID is returned by the insert
+        new_ID = db_manager.new_user(
             new_user['Name'], new_user['Lastname'])
-        data = db_manager.get_users()
-        # * get the last ID
-        if data == []:
-            new_ID = 1
-        else:
-            new_ID = data[-1][0]
         print(f"User {new_ID} created")
 
 
 # ? searchUser - Command
 # * This command searches for a user with the specified ID in the database.
 # * - If the ID is not provided, it raises an error.
-# * - It retrieves the list of users from the database.
-# * - If no users are found, it prints a message.
+# * - It looks up the user by primary key in the database.
+# * - If no user is found, it prints a message.
 # * - If a user with the specified ID is found, it prints their ID, name, and lastname.
 
 
@@ -87,25 +305,19 @@ def searchUser(ctx, id):
     if not id:
         ctx.fail("ID is required")
     else:
-        data = db_manager.get_users()
-
-        if data == []:
-            print("No users found")
-            return
-
-        user = next((x for x in data if x[0] == id), None)
+        user = db_manager.get_user(id)
 
         if user is None:
             print("User not found")
         else:
-            print(f"User {user[0]} - {user[1]} - {user[2]}")
+            print(f"User {user.id} - {user.name} - {user.lastname}")
 
 
 # ? deleteUser - Command
 # * This command deletes a user with the specified ID from the database.
 # * - If the ID is not provided, it raises an error.
-# * - It retrieves the list of users from the database.
-# * - If no users are found, it prints a message.
+# * - It looks up the user by primary key in the database.
+# * - If no user is found, it prints a message.
 # * - If a user with the specified ID is found, it deletes the user and prints a confirmation message.
 
 
@@ -117,26 +329,20 @@ def deleteUser(ctx, id):
         ctx.fail("ID is required")
     else:
 
-        data = db_manager.get_users()
-
-        if data == []:
-            print("No users found")
-            return
-
-        user = next((x for x in data if x[0] == id), None)
+        user = db_manager.get_user.uncached(id)
 
         if user is None:
             print("User not found")
         else:
-            db_manager.delete_user(user[0])
-            print(f"User {user[0]} deleted")
+            db_manager.delete_user(user.id)
+            print(f"User {user.id} deleted")
 
 
 # ? updateUser - Command
 # * This command updates the information of a user with the specified ID in the database.
 # * - The ID is required, and if not provided, it raises an error.
-# * - It retrieves the list of users from the database.
-# * - If no users are found, it prints a message.
+# * - It looks up the user by primary key in the database, bypassing the query cache.
+# * - If no user is found, it prints a message.
 # * - If a user with the specified ID is found, it updates the user's information.
 # * - If the name or lastname options are not provided, it uses the existing values.
 # * - It prints a confirmation message after updating the user.
@@ -152,18 +358,16 @@ def updateUser(ctx, id, name, lastname):
         ctx.fail("ID is required")
     else:
 
-        data = db_manager.get_users()
+        user = db_manager.get_user.uncached(id)
 
-        if data == []:
-            print("No users found")
+        if user is None:
+            print("User not found")
             return
 
-        user = next((x for x in data if x[0] == id), None)
-
         if not name:
-            name = user[1]
+            name = user.name
         if not lastname:
-            lastname = user[2]
+            lastname = user.lastname
 
         db_manager.update_user(id, name, lastname)
         print(f"User {id} updated")
@@ -174,42 +378,38 @@ def updateUser(ctx, id, name, lastname):
 # ? pets - Command
 # * This command retrieves the pets belonging to a user with the specified ID from the database.
 # * - The user ID is required, and if not provided, it raises an error.
-# * - It retrieves the list of pets for the user from the database.
-# * - It retrieves the list of users from the database.
-# * - If no users are found, it prints a message.
-# * - If a user with the specified ID is found, it retrieves their name.
+# * - It reads the user and their pets with one query, `db_manager.user_with_pets()`.
 # * - If the user is not found, it prints a message.
 # * - If the user has no pets, it prints a message indicating that.
 # * - If the user has pets, it prints their name and displays their details in a DataFrame.
+# * - With '--format', the pets are written in that format instead, see `write_rows()`.
 
 @cli.command()
 @click.argument('id', type=int)
+@format_option
 @click.pass_context
-def pets(ctx, id):
+def pets(ctx, id, fmt):
     if not id:
         ctx.fail("User ID is required")
     else:
 
-        pets = db_manager.user_pets(id)
-        user = db_manager.get_users()
+        found = db_manager.user_with_pets(id)
 
-        if user == []:
-            print("No users found")
+        if found is None:
+            print("User not found")
             return
 
-        user_name = next((x for x in user if x[0] == id), None)
+        user_name, pets = found
 
-        if user_name is None:
-            print("User not found")
+        if fmt != 'table':
+            write_rows(pets, ['ID', 'Category', 'Name', 'Sex', 'Age'], fmt)
         else:
             if not pets:
-                print(f"{user_name[1]} {user_name[2]} has no pets")
+                print(f"{user_name.name} {user_name.lastname} has no pets")
                 return
             else:
-                print(f"Pets of {user_name[1]} {user_name[2]}")
-                pets_df = pd.DataFrame(
-                    pets, columns=['ID', 'Category', 'Name', 'Sex', 'Age'])
-                print(pets_df)
+                print(f"Pets of {user_name.name} {user_name.lastname}")
+                print_table(pets, ['ID', 'Category', 'Name', 'Sex', 'Age'])
 
 
 # ? petList - Command
@@ -217,20 +417,25 @@ def pets(ctx, id):
 # * - If no pets are found, it prints a message. Otherwise, it prints the number
 # * of pets and displays their details, including the category, name, sex, owner, and age,
 # * in a DataFrame.
+# * - It accepts the pagination and streaming options of `listing_options()`.
 
 @cli.command()
-def petList():
+@listing_options
+def petList(limit, offset, after_id, stream, fmt):
+
+    if stream or fmt != 'table':
+        write_rows(db_manager.stream_listing(
+            "pets", (), limit, offset, after_id), ['ID', 'Category', 'Name', 'Sex', 'Owner', 'Age'], 'tsv' if fmt == 'table' else fmt)
+        return
 
-    pets = db_manager.get_pets()
+    pets = db_manager.load_listing("pets", (), limit, offset, after_id)
 
-    if pets == []:
+    if len(pets) == 0:
         print("No pets found")
         return
 
     print(f"There are {len(pets)} pets")
-    pets_df = pd.DataFrame(
-        pets, columns=['ID', 'Category', 'Name',  'Sex', 'Owner', 'Age'])
-    print(pets_df)
+    print_table(pets, ['ID', 'Category', 'Name',  'Sex', 'Owner', 'Age'])
 
 
 # ? newPet - Command
@@ -242,8 +447,10 @@ def petList():
 # *   - sex: Sex of the pet
 # *   - age: Age of the pet
 # * - If any of the required parameters are missing, the command fails with an appropriate error message.
-# * - After successfully creating the pet, it retrieves the user's information and prints a message confirming
-# *   the creation of the pet for the user.
+# * - It creates the pet and reads its owner with one statement, `db_manager.create_pet_for_owner()`.
+# *   If the user doesn't exist it prints a message and creates nothing.
+# * - If the category doesn't exist, the foreign key refuses the pet and it prints a message.
+# * - After successfully creating the pet, it prints a message confirming the creation of the pet for the user.
 
 @cli.command()
 @click.argument('id', type=int)
@@ -264,15 +471,18 @@ def newPet(ctx, id, category, name, sex, age):
         ctx.fail("age is required")
     else:
 
-        db_manager.create_pet(id, category, name, sex, age)
-        user = db_manager.get_users()
+        try:
+            created = db_manager.create_pet_for_owner(id, category, name, sex, age)
+        except db_manager.sql.IntegrityError:
+            print("Category not found")
+            return
 
-        if user == []:
-            print("No users found")
+        if created is None:
+            print("User not found")
             return
 
-        user_name = next((x for x in user if x[0] == id), None)
-        print(f"Pet {name} created for {user_name[1]} {user_name[2]}")
+        pet_id, user_name = created
+        print(f"Pet {name} ({pet_id}) created for {user_name.name} {user_name.lastname}")
 
 
 # ? updatePet - Command
@@ -286,7 +496,9 @@ def newPet(ctx, id, category, name, sex, age):
 # *   - owner: Owner of the pet
 # *   - age: Age of the pet
 # * - If the pet with the given ID is not found, it prints a message indicating that the pet was not found.
-# * - If any of the optional parameters are not provided, the existing values of the corresponding fields are retained.
+# * - If any of the optional parameters are not provided, the existing values of the corresponding fields are retained,
+# *   they are read from the database, not from the query cache.
+# * - If the new category or owner doesn't exist, the foreign keys refuse the update and it prints a message.
 # * - After successfully updating the pet, it prints a message confirming the update.
 
 @cli.command()
@@ -303,25 +515,28 @@ def updatePet(ctx, id, category, name, sex, owner, age):
         ctx.fail("Pet ID is required")
     else:
 
-        data = db_manager.get_pet(id)
-        pet = data
+        pet = db_manager.get_pet.uncached(id)
 
-        if pet == []:
+        if pet is None:
             print("Pet not found")
             return
 
         if not category:
-            category = pet[1]
+            category = pet.category_id
         if not name:
-            name = pet[2]
+            name = pet.name
         if not sex:
-            sex = pet[3]
+            sex = pet.sex
         if not owner:
-            owner = pet[4]
+            owner = pet.user_id
         if not age:
-            age = pet[5]
+            age = pet.age
 
-        db_manager.update_pet(id, category, name, sex, owner, age)
+        try:
+            db_manager.update_pet(id, category, name, sex, owner, age)
+        except db_manager.sql.IntegrityError:
+            print("Category or owner not found")
+            return
         print(f"Pet {name} updated")
 
 
@@ -342,14 +557,13 @@ def deletePet(ctx, id):
         ctx.fail("Pet ID is required")
     else:
 
-        data = db_manager.get_pet(id)
-        pet = data
+        pet = db_manager.get_pet.uncached(id)
 
-        if not pet:
+        if pet is None:
             print("Pet not found")
         else:
             db_manager.delete_pet(id)
-            print(f"Pet {pet[2]} deleted")
+            print(f"Pet {pet.name} deleted")
 
 
 # ? categorys - Command
@@ -359,11 +573,18 @@ def deletePet(ctx, id):
 # * - The DataFrame includes the following columns:
 # *   - ID: Category ID
 # *   - Category name: Name of the category
+# * - It accepts the pagination and streaming options of `listing_options()`.
 
 @cli.command()
-def categorys():
+@listing_options
+def categorys(limit, offset, after_id, stream, fmt):
 
-    categorys = db_manager.view_categorys()
+    if stream or fmt != 'table':
+        write_rows(db_manager.stream_listing(
+            "categorys", (), limit, offset, after_id), ['ID', 'Category name'], 'tsv' if fmt == 'table' else fmt)
+        return
+
+    categorys = db_manager.view_categorys(limit, offset, after_id)
 
     if categorys == []:
         print("No categorys found")
@@ -371,9 +592,7 @@ def categorys():
 
     print(f"There are {len(categorys)} categorys")
 
-    categorys_df = pd.DataFrame(
-        categorys, columns=['ID', 'Category name'])
-    print(categorys_df)
+    print_table(categorys, ['ID', 'Category name'])
 
 
 def get_category(id):
@@ -382,7 +601,7 @@ def get_category(id):
 
     if category == None:
         return None
-    return category[0]
+    return category.name
 
 
 # ? petsCategory - Command
@@ -397,11 +616,13 @@ def get_category(id):
 # *   - Sex: Sex of the pet
 # *   - Owner: Owner of the pet
 # *   - Age: Age of the pet
+# * - It accepts the pagination and streaming options of `listing_options()`.
 
 @cli.command()
 @click.argument('id', type=int)
+@listing_options
 @click.pass_context
-def petsCategory(ctx, id):
+def petsCategory(ctx, id, limit, offset, after_id, stream, fmt):
 
     if not id:
         ctx.fail("Category ID is required")
@@ -414,16 +635,19 @@ def petsCategory(ctx, id):
             print("Category not found")
             return
 
-        pets = db_manager.category_pets(id)
+        if stream or fmt != 'table':
+            write_rows(db_manager.stream_listing(
+                "category_pets", (id,), limit, offset, after_id), ['ID', 'Name', 'Sex', 'Owner', 'Age'], 'tsv' if fmt == 'table' else fmt)
+            return
+
+        pets = db_manager.category_pets(id, limit, offset, after_id)
 
         print(f"there are {len(pets)} pets in category {category}")
 
         if pets == []:
             return
 
-        pets_df = pd.DataFrame(
-            pets, columns=['ID', 'Name',  'Sex', 'Owner', 'Age'])
-        print(pets_df)
+        print_table(pets, ['ID', 'Name',  'Sex', 'Owner', 'Age'])
 
 
 # ? newCategory - Command
@@ -451,6 +675,7 @@ def newCategory(name):
 # * - If the 'id' argument is not provided, it prints an error message indicating that the Category ID is required.
 # * - If the provided category ID is valid and exists in the database, it deletes the category and prints a success message.
 # * - If the provided category ID does not exist in the database, it prints a message indicating that the category was not found.
+# * - If the category still has pets, it's not deleted and it prints a message.
 
 @cli.command()
 @click.argument('id', type=int)
@@ -466,43 +691,685 @@ def deleteCategory(id):
         print("Category not found")
         return
 
-    db_manager.delete_category(id)
+    try:
+        db_manager.delete_category(id)
+    except db_manager.sql.IntegrityError:
+        print(f"Category {category} has pets, move or delete them first")
+        return
     print(f"Category {category} deleted")
 
+# ! batch commands
+
+# ? Batch Options
+# * This decorator adds the options that select the rows of a batch command.
+# * - The 'ids' arguments are the IDs of the rows, e.g. `deletePets 4 8 15`.
+# * - The '--ids-file' option reads more IDs from a file ('-' for stdin), separated by
+# *   spaces, commas or new lines.
+# * - The '--where' option (repeatable) selects the rows where COLUMN=VALUE, e.g.
+# *   `--where UserID=42`. With IDs, the rows must also match it.
+
+def batch_options(command):
+
+    command = click.option('--where', 'filters', multiple=True, help="COLUMN=VALUE the rows must match")(command)
+    command = click.option('--ids-file', type=click.File('r'), help="File with IDs, '-' for stdin")(command)
+    command = click.argument('ids', nargs=-1, type=int)(command)
+    return command
+
+
+# ? Parse Pairs
+# * This function turns COLUMN=VALUE options into a dictionary, or fails with a message.
+
+def parse_pairs(ctx, pairs, option):
+
+    if any('=' not in pair for pair in pairs):
+        ctx.fail(f"{option} must be COLUMN=VALUE")
+    return dict(pair.split('=', 1) for pair in pairs)
+
+
+# ? Run Batch
+# * This function reads the IDs and filters of a batch command and runs the mutation.
+# ! @param ctx - The click context, to fail with a message.
+# ! @param table - 'Users', 'Pets' or 'Categorys'.
+# ! @param values - The COLUMN=VALUE pairs to set, or None to delete the rows.
+# * - It prints the number of rows deleted or updated.
+
+def run_batch(ctx, table, ids, ids_file, filters, values=None):
+
+    ids = list(ids)
+
+    if ids_file:
+        for word in ids_file.read().replace(',', ' ').split():
+            try:
+                ids.append(int(word))
+            except ValueError:
+                ctx.fail(f"Invalid ID in --ids-file: {word}")
+
+    filters = parse_pairs(ctx, filters, "--where")
+
+    action = "deleted" if values is None else "updated"
+
+    try:
+        if values is None:
+            count = db_manager.delete_many(table, ids, filters)
+        else:
+            count = db_manager.update_many(table, parse_pairs(ctx, values, "--set"), ids, filters)
+    except ValueError as error:
+        ctx.fail(str(error))
+    except db_manager.sql.IntegrityError:
+        ctx.fail(f"The pets would reference missing rows, nothing was {action}")
+
+    print(f"{count} {table.lower()} {action}")
+
+
+# ? deleteUsers / deletePets / deleteCategorys - Commands
+# * These commands delete many rows at once, selected with `batch_options()`.
+# * - The rows are deleted with one statement per 500 IDs, all in one transaction.
+# * - e.g. `deletePets --where UserID=42` deletes all the pets of the user 42.
+
+@cli.command()
+@batch_options
+@click.pass_context
+def deleteUsers(ctx, ids, ids_file, filters):
+    run_batch(ctx, "Users", ids, ids_file, filters)
+
+
+@cli.command()
+@batch_options
+@click.pass_context
+def deletePets(ctx, ids, ids_file, filters):
+    run_batch(ctx, "Pets", ids, ids_file, filters)
+
+
+@cli.command()
+@batch_options
+@click.pass_context
+def deleteCategorys(ctx, ids, ids_file, filters):
+    run_batch(ctx, "Categorys", ids, ids_file, filters)
+
+
+# ? updatePets - Command
+# * This command updates many pets at once, selected with `batch_options()`.
+# * - The '--set' option (repeatable) gives the new COLUMN=VALUE.
+# * - e.g. `updatePets --set CategoryID=3 --where CategoryID=7` moves every pet of the
+# *   category 7 to the category 3.
+
+@cli.command()
+@batch_options
+@click.option('--set', 'values', multiple=True, required=True, help="COLUMN=VALUE to set")
+@click.pass_context
+def updatePets(ctx, ids, ids_file, filters, values):
+    run_batch(ctx, "Pets", ids, ids_file, filters, values)
+
+
+# ! search
+
+# ? search - Command
+# * This command finds users, pets and categorys by name with the full-text search index.
+# * - It takes the 'text' argument, the words to search. Every word must match, as a prefix
+# *   of a word in the name ("ma pe" finds "Max Pérez"), case and accents are ignored.
+# * - The '--in' option only searches users, pets or categorys.
+# * - The '--owner' option only finds pets whose owner's name or lastname matches,
+# *   e.g. `search max --owner pérez`. The text can be left out to list all their pets.
+# * - The '--exact' option matches whole words instead of prefixes.
+# * - The results are ranked, best matches first, up to '--limit' of each kind.
+# * - With '--format', the results are written in that format, with a 'Type' column when
+# *   several kinds are searched.
+
+SEARCH_COLUMNS = {
+    'users': ['ID', 'Name', 'Lastname'],
+    'pets': ['ID', 'Name', 'Category', 'Owner'],
+    'categorys': ['ID', 'Name'],
+}
+
+
+@cli.command()
+@click.argument('text', required=False, default="")
+@click.option('--in', 'kind', type=click.Choice(['all', 'users', 'pets', 'categorys'], case_sensitive=False), default='all', show_default=True, help="What to search")
+@click.option('--owner', help="Only pets whose owner matches these words")
+@click.option('--exact', is_flag=True, help="Match whole words, not prefixes")
+@click.option('--limit', type=click.IntRange(min=1), default=20, show_default=True, help="Max results of each kind")
+@format_option
+@click.pass_context
+def search(ctx, text, kind, owner, exact, limit, fmt):
+
+    if not text.strip() and not owner:
+        ctx.fail("Text to search is required")
+
+    if owner:
+        kind = 'pets'
+
+    prefix = not exact
+    results = {}
+
+    if kind in ('all', 'users') and text.strip():
+        results['users'] = db_manager.search_users(text, prefix, limit)
+    if kind in ('all', 'pets'):
+        results['pets'] = db_manager.search_pets(text, owner, prefix, limit)
+    if kind in ('all', 'categorys') and text.strip():
+        results['categorys'] = db_manager.search_categorys(text, prefix, limit)
+
+    if fmt != 'table':
+        if len(results) == 1:
+            (name, rows), = results.items()
+            write_rows(rows, SEARCH_COLUMNS[name], fmt)
+        else:
+            write_rows(((name, row[0], row[1], " - ".join(map(str, row[2:])))
+                        for name, rows in results.items() for row in rows),
+                       ['Type', 'ID', 'Name', 'Details'], fmt)
+        return
+
+    if not any(results.values()):
+        print("Nothing found")
+        return
+
+    for name, rows in results.items():
+        if rows:
+            print(f"{name.capitalize()} ({len(rows)})")
+            print_table(rows, SEARCH_COLUMNS[name])
+
+
+# ! maintenance
+
+# ? migrate - Command
+# * This command applies the pending schema migrations of the database, see `db_manager.migrate()`.
+# * - It prints each applied migration with the time it took.
+# * - The '--status' flag only lists the migrations, with the date and time of the applied ones.
+# * - If a migration fails, it's rolled back and the command fails with its error, e.g. the
+# *   orphaned pets that 'repair' has to remove before the foreign keys are added.
+
+@cli.command()
+@click.option('--status', is_flag=True, help="List the migrations without applying them")
+def migrate(status):
+
+    if status:
+        for version, description, applied_at, seconds in db_manager.migration_status():
+            state = f"applied {applied_at} ({seconds:.2f} s)" if applied_at else "pending"
+            print(f"{version:>4}  {description:55} {state}")
+        return
+
+    try:
+        applied = db_manager.migrate()
+    except db_manager.sql.DatabaseError as error:
+        version = db_manager.schema_version()
+        raise click.ClickException(f"Migration {version + 1} failed: {error}. "
+                                   f"The database is at version {version}")
+
+    for version, description, seconds in applied:
+        print(f"Migration {version}: {description} ({seconds:.2f} s)")
+    print(f"The database is at version {db_manager.schema_version()}")
+
+
+# ? repair - Command
+# * This command removes the orphaned pets, adds the foreign keys to old databases and
+# * compacts the file, with `db_manager.repair_db()`.
+# * - The '--no-vacuum' flag skips the compaction, which rewrites the whole file.
+# * - It prints what was repaired and the size of the database before and after.
+
+@cli.command()
+@click.option('--no-vacuum', is_flag=True, help="Don't compact the database file")
+def repair(no_vacuum):
+
+    result = db_manager.repair_db(vacuum=not no_vacuum)
+
+    print(f"{result['orphans']} orphaned pets removed")
+    if result['rebuilt']:
+        print("Foreign keys added to the pets table")
+    for search in result['search']:
+        print(f"Search index {search} rebuilt")
+    print(f"Size {result['before'] / 1e6:.1f} MB -> {result['after'] / 1e6:.1f} MB "
+          f"in {result['seconds']:.2f} s")
+
+
+# ? backup - Command
+# * This command copies the database while it's in use, with `db_manager.backup_db()`.
+# * - The '--output' option sets the backup file, by default 'backups/data-<date>.db' with the
+# *   extension of the codec.
+# * - The '--compress' option compresses the copy with gzip, xz or zstd (zstandard package).
+# * - The '--pages' option sets the pages copied per step and '--sleep' the seconds waited
+# *   between steps, to throttle the backup of a large database.
+# * - It shows the progress on stderr and prints the size of the backup and the time taken.
+
+@cli.command()
+@click.option('--output', type=click.Path(dir_okay=False), help="Backup file, by default in 'backups'")
+@click.option('--compress', 'compression', type=click.Choice(list(db_manager.BACKUP_CODECS)), help="Compress the backup")
+@click.option('--pages', type=int, default=db_manager.BACKUP_PAGES, show_default=True, help="Pages copied per step, -1 for one step")
+@click.option('--sleep', type=click.FloatRange(min=0), default=db_manager.BACKUP_SLEEP, show_default=True, help="Seconds to wait between steps")
+def backup(output, compression, pages, sleep):
+
+    if compression == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise click.UsageError("zstandard is required to compress with zstd")
+
+    if output is None:
+        extension = db_manager.BACKUP_CODECS[compression][0] if compression else ""
+        output = os.path.join('backups', f"data-{time.strftime('%Y%m%d-%H%M%S')}.db{extension}")
+
+    bar = None
+
+    def progress(remaining, total):
+        nonlocal bar
+        if bar is None:
+            bar = click.progressbar(length=total, label="Backup", file=sys.stderr)
+            bar.__enter__()
+        bar.update(total - remaining - bar.pos)
+
+    try:
+        result = db_manager.backup_db(output, compression, pages, sleep, progress)
+    finally:
+        if bar is not None:
+            bar.__exit__(None, None, None)
+
+    print(f"Backup of {result['size'] / 1e6:.1f} MB saved to {result['path']} "
+          f"({result['bytes'] / 1e6:.1f} MB) in {result['seconds']:.2f} s")
+
+
+# ? restore - Command
+# * This command replaces the database with a backup, with `db_manager.restore_db()`.
+# * - The backup can be plain or compressed, the codec is detected from the file.
+# * - It asks for confirmation unless the '--yes' flag is given.
+
+@cli.command()
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.confirmation_option(prompt="The current data will be replaced by the backup, continue?")
+def restore(path):
+
+    try:
+        result = db_manager.restore_db(path)
+    except ImportError:
+        raise click.UsageError("zstandard is required to restore zstd backups")
+    except db_manager.sql.DatabaseError as error:
+        raise click.ClickException(f"Can't restore {path}: {error}")
+
+    codec = f"{result['codec']} " if result['codec'] else ""
+    print(f"Restored {result['pages']} pages from the {codec}backup {path} "
+          f"in {result['seconds']:.2f} s")
+
+
+# ! statistics
+
+# ? stats - Command
+# * This command prints the pet statistics, computed inside SQLite by `db_manager.pet_stats()`.
+# * - It prints the totals and ages, the pets per category and per sex, an age histogram
+# *   and the owners with most pets.
+# * - The '--top' option sets the number of owners, '--bucket' the years per histogram bar.
+# * - The '--format json' option prints the statistics as JSON.
+# * - The '--materialize' option creates the 'PetStats' summary table, kept up to date by
+# *   triggers, so the next reports don't scan the pets. '--drop-summary' removes it.
+
+@cli.command()
+@click.option('--top', type=click.IntRange(min=0), default=10, show_default=True, help="Owners with most pets to show")
+@click.option('--bucket', type=click.IntRange(min=1), default=1, show_default=True, help="Years per age histogram bar")
+@click.option('--format', 'fmt', type=click.Choice(['table', 'json'], case_sensitive=False), default='table', show_default=True, help="Output format")
+@click.option('--materialize', is_flag=True, help="Keep a summary table updated on every pet write")
+@click.option('--drop-summary', is_flag=True, help="Remove the summary table")
+def stats(top, bucket, fmt, materialize, drop_summary):
+
+    if (materialize or drop_summary) and db_manager.pool.readonly:
+        raise click.UsageError("The summary table can't be changed in read-only mode")
+    if drop_summary:
+        db_manager.drop_pet_stats()
+    if materialize:
+        db_manager.create_pet_stats()
+
+    data = db_manager.pet_stats(top, bucket)
+
+    if fmt == 'json':
+        print(json.dumps(data, indent=2))
+        return
+
+    if data['total'] == 0:
+        print("No pets found")
+        return
+
+    print(f"There are {data['total']} pets, ages {data['min_age']} to "
+          f"{data['max_age']} (average {data['avg_age']:.1f})")
+
+    print("\nPets per category")
+    for category_id, name, count in data['by_category']:
+        print(f"  {category_id:>6} {name:30} {count:>10}")
+
+    print("\nPets per sex")
+    for sex, count in data['by_sex']:
+        print(f"  {str(sex):37} {count:>10} ({count / data['total']:.1%})")
+
+    print("\nAge histogram")
+    peak = max(count for age, count in data['by_age'])
+    for age, count in data['by_age']:
+        label = f"{age}" if bucket == 1 else f"{age}-{age + bucket - 1}"
+        bar = "#" * max(1, round(40 * count / peak))
+        print(f"  {label:>9} {count:>10} {bar}")
+
+    print(f"\nTop {top} owners")
+    for user_id, name, lastname, count in data['top_owners']:
+        print(f"  {user_id:>6} {name + ' ' + lastname:30} {count:>10}")
+
+
+# ! imports
+
+# ? import - Command
+# * This command bulk loads users, pets or categorys from a CSV, JSONL or Excel file.
+# * - It takes the 'path' argument, the file to import.
+# * - The '--table' option selects the table, it's required for CSV and JSONL files.
+# * - For Excel files without '--table', the 'Categories', 'Users' and 'Pets' sheets are imported
+# *   in that order, so the pets can reference the imported users and categorys.
+# * - If a sheet to import is missing from the Excel file, it fails before importing anything.
+# * - The '--format' option overrides the format guessed from the file extension.
+# * - The '--batch-size' option sets the number of rows committed per transaction.
+# * - For each table, it prints the inserted and rejected rows and the rows per second.
+
+@cli.command(name="import")
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--table', type=click.Choice(['users', 'pets', 'categorys'], case_sensitive=False), help="Table to import")
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl', 'xlsx'], case_sensitive=False), help="Format of the file")
+@click.option('--batch-size', type=click.IntRange(min=1), default=5000, show_default=True, help="Rows per transaction")
+@click.pass_context
+def importData(ctx, path, table, fmt, batch_size):
+
+    if not fmt:
+        fmt = path.rsplit('.', 1)[-1].lower()
+        if fmt == 'json':
+            fmt = 'jsonl'
+        if fmt not in ('csv', 'jsonl', 'xlsx'):
+            ctx.fail("Unknown file format, use --format")
+
+    if table:
+        table = {'users': 'Users', 'pets': 'Pets',
+                 'categorys': 'Categorys'}[table.lower()]
+
+    if fmt == 'xlsx':
+        sheets = {v: k for k, v in db_manager.SHEET_TABLES.items()}
+        tables = [table] if table else ['Categorys', 'Users', 'Pets']
+        names = db_manager.xlsx_sheets(path)
+        missing = [sheets[t] for t in tables if sheets[t] not in names]
+        if missing:
+            ctx.fail(f"Missing sheets in {path}: {', '.join(missing)}")
+        sources = [(t, db_manager.read_xlsx(path, sheets[t])) for t in tables]
+    elif not table:
+        ctx.fail("--table is required for CSV and JSONL files")
+    elif fmt == 'csv':
+        sources = [(table, db_manager.read_csv(path))]
+    else:
+        sources = [(table, db_manager.read_jsonl(path))]
+
+    for table, rows in sources:
+        result = db_manager.bulk_import(table, rows, batch_size)
+        print(f"{table}: {result['inserted']} rows imported, "
+              f"{result['rejected']} rejected "
+              f"({result['rows_per_sec']:.0f} rows/sec)")
+
+
 # ! exports
 
 # ? exportExcel - Command
 # * This command exports the database data to an Excel file.
 # * - It calls the 'export_excel' function from 'db_manager' module to perform the export.
+# * - With the '--incremental' flag, only the rows changed since the last export are read from
+# *   the database, but the old file is read and rewritten whole, which is usually slower
+# *   than a full export (see `db_manager.export_excel()`).
 # * - After the export is completed, it prints a message indicating that the Excel file has been exported.
 
 
 @cli.command()
-def exportExcel():
+@click.option('--incremental', is_flag=True, help="Only read the rows changed since the last export from the database (the file is still rewritten whole, usually slower than a full export)")
+def exportExcel(incremental):
 
-    db_manager.export_excel()
+    db_manager.export_excel(incremental=incremental)
     print("Excel exported")
 
 
+# ? exportParquet / exportArrow - Commands
+# * These commands export the tables to compressed columnar files for analytics tools.
+# * - They call `db_manager.export_columnar()`: one file per table, plus 'pets_view' (the
+# *   pets with their category and owner names) and a 'manifest.json' of the snapshot.
+# * - The '--output' option sets the folder of the files, by default 'export'.
+# * - The '--table' option (repeatable) selects the files to export, by default all of them.
+# * - The '--compression' option selects the codec, 'zstd' by default.
+# * - They need pyarrow, and print the rows written to each file.
+
+def columnar_options(fmt):
+
+    def decorate(command):
+        command = click.option('--compression', type=click.Choice(db_manager.COLUMNAR_FORMATS[fmt][1]), default='zstd', show_default=True, help="Compression codec")(command)
+        command = click.option('--table', 'tables', multiple=True, type=click.Choice(list(db_manager.COLUMNAR_TABLES), case_sensitive=False), help="Table to export")(command)
+        command = click.option('--output', type=click.Path(file_okay=False), default='export', show_default=True, help="Folder of the files")(command)
+        return command
+
+    return decorate
+
+
+def export_columnar(fmt, output, tables, compression):
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise click.UsageError(f"pyarrow is required to export {fmt} files")
+
+    manifest = db_manager.export_columnar(
+        output, fmt, [table.lower() for table in tables] or None, compression)
+
+    for name, table in manifest["tables"].items():
+        print(f"{name}: {table['rows']} rows -> {os.path.join(output, table['file'])}")
+
+
+@cli.command()
+@columnar_options('parquet')
+def exportParquet(output, tables, compression):
+    export_columnar('parquet', output, tables, compression)
+
+
+@cli.command()
+@columnar_options('arrow')
+def exportArrow(output, tables, compression):
+    export_columnar('arrow', output, tables, compression)
+
+
+# ? exportAll - Command
+# * This command writes every export at once from one consistent snapshot of the database.
+# * - It calls `db_manager.export_all()`, which runs the exports in parallel processes.
+# * - The '--output' option sets the folder of the files, by default 'export'.
+# * - The '--format' option (repeatable) selects the exports, by default all of them.
+# * - The '--workers' option sets the number of processes, by default one per CPU.
+# * - The '--compression' option selects the codec of the Parquet and Arrow files.
+# * - The '--incremental' flag patches the Excel file instead of rewriting it.
+# * - It prints the time of each export and the total time.
+
+@cli.command()
+@click.option('--output', type=click.Path(file_okay=False), default='export', show_default=True, help="Folder of the files")
+@click.option('--format', 'formats', multiple=True, type=click.Choice(db_manager.EXPORT_FORMATS, case_sensitive=False), help="Export to write")
+@click.option('--workers', type=click.IntRange(min=1), help="Number of processes")
+@click.option('--compression', type=click.Choice(['zstd', 'none']), default='zstd', show_default=True, help="Codec of the Parquet and Arrow files")
+@click.option('--incremental', is_flag=True, help="Only apply the rows changed since the last Excel export")
+def exportAll(output, formats, workers, compression, incremental):
+
+    formats = [fmt.lower() for fmt in formats] or db_manager.EXPORT_FORMATS
+
+    if any(fmt in ('parquet', 'arrow') for fmt in formats):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise click.UsageError("pyarrow is required to export parquet and arrow files")
+
+    start = time.perf_counter()
+    results = db_manager.export_all(output, formats, workers, compression, incremental)
+
+    for name, (result, seconds) in results.items():
+        print(f"{name:20} {seconds:8.2f} s")
+    print(f"Exported to {output} in {time.perf_counter() - start:.2f} s")
+
+
 # ? exportPDF - Command
 # * This command exports the database data to a PDF file.
 # * - It calls the 'export_pdf' function from 'db_manager' module to perform the export.
+# * - The '--table' option (repeatable) selects the sections to export, by default all of them.
+# * - The '--columns' option selects the columns to show, as a comma separated list.
+# * - The '--filter' option (repeatable) keeps the rows where COLUMN=VALUE.
+# * - The '--sort' option orders the rows by a column, '--desc' reverses the order.
+# * - If a column doesn't exist in a section, it fails with an error message.
+# * - The tables are created while the pages are laid out, but the pages stay in memory until
+# *   the file is saved, so very large exports need roughly 0.5 KB per row.
 # * - After the export is completed, it prints a message indicating that the PDF file has been exported.
 
 @cli.command()
-def exportPDF():
+@click.option('--table', 'tables', multiple=True, type=click.Choice(['users', 'pets', 'categorys'], case_sensitive=False), help="Section to export")
+@click.option('--columns', help="Comma separated columns to show")
+@click.option('--filter', 'filters', multiple=True, help="COLUMN=VALUE to keep")
+@click.option('--sort', help="Column to order by")
+@click.option('--desc', is_flag=True, help="Descending order")
+@click.pass_context
+def exportPDF(ctx, tables, columns, filters, sort, desc):
+
+    sections = [{'users': 'Users', 'pets': 'Pets', 'categorys': 'Categorys'}[t.lower()]
+                for t in tables] or None
 
-    db_manager.export_pdf()
+    if columns:
+        columns = [column.strip() for column in columns.split(',')]
+
+    if any('=' not in f for f in filters):
+        ctx.fail("Filters must be COLUMN=VALUE")
+    filters = dict(f.split('=', 1) for f in filters)
+
+    if sort and desc:
+        sort = f"-{sort}"
+
+    try:
+        db_manager.export_pdf(sections=sections, columns=columns,
+                              filters=filters, sort=sort)
+    except ValueError as error:
+        ctx.fail(str(error))
     print("PDF exported")
 
+# ! shell
+
+# ? Run Line
+# * This function runs one CLI command line inside the current process.
+# ! @param line - The command line, e.g. 'updatePet 4 --name Max'.
+# * - The line is split with `shlex.split()` and passed to the 'cli' group without
+# *   exiting the process, so imports and pooled connections stay warm between lines.
+# * - Everything the command prints is captured.
+# * - The command gets an empty stdin: the next lines of the shell are commands, so a
+# *   prompt (e.g. 'restore' without '--yes') or '--ids-file -' must not read them. A prompt
+# *   aborts the command, pass the answer as an option instead.
+# * - It returns a dictionary with the 'command', 'ok', the captured 'output' and, if the
+# *   command failed, the 'error' message.
+
+def run_line(line):
+
+    result = {"command": line, "ok": True, "output": ""}
+    output = io.StringIO()
+
+    try:
+        args = shlex.split(line)
+
+        if args and args[0].lower() == "shell":
+            raise click.UsageError("shell can't be nested")
+
+        stdin, sys.stdin = sys.stdin, io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                cli.main(args, prog_name="cli", standalone_mode=False)
+        finally:
+            sys.stdin = stdin
+
+    except click.exceptions.Exit:
+        pass
+    except click.exceptions.Abort:
+        result["ok"] = False
+        result["error"] = "Aborted, commands in the shell can't read input"
+    except click.ClickException as error:
+        result["ok"] = False
+        result["error"] = error.format_message()
+    except Exception as error:
+        result["ok"] = False
+        result["error"] = f"{type(error).__name__}: {error}"
+
+    result["output"] = output.getvalue()
+    return result
+
+
+# ? Run Lines
+# * This function runs every command line of a stream and writes one JSON result per line.
+# ! @param lines - An iterable of command lines, blank lines and '#' comments are skipped.
+# ! @param out - The text stream where the JSON lines are written.
+
+def run_lines(lines, out):
+
+    for line in lines:
+        line = line.strip()
+
+        if not line or line.startswith("#"):
+            continue
+
+        out.write(json.dumps(run_line(line)) + "\n")
+        out.flush()
+
+
+# ? shell - Command
+# * This command keeps one warm process to run many commands, useful for scripts.
+# * - By default it reads one command per line from stdin, the '--file' option reads them from a file.
+# * - The '--socket' option serves the commands on a local Unix socket instead, each client
+# *   sends command lines and gets the results back on the same connection. An old socket
+# *   at that path is replaced, any other existing file is refused.
+# * - Every command is answered with a JSON line: {"command", "ok", "output", "error"}.
+# * - Other processes can write the database while the shell runs, so its query cache keeps
+# *   results for '--cache-ttl' seconds only (SHELL_CACHE_TTL), 0 turns it off.
+
+SHELL_CACHE_TTL = 1.0
+
+
+@cli.command()
+@click.option('--file', 'file', type=click.File('r'), help="File with one command per line")
+@click.option('--socket', 'socket_path', type=click.Path(), help="Unix socket to serve the commands")
+@click.option('--cache-ttl', type=click.FloatRange(min=0), default=SHELL_CACHE_TTL, show_default=True, help="Seconds the query results are cached, 0 turns the cache off")
+def shell(file, socket_path, cache_ttl):
+
+    if cache_ttl:
+        db_manager.configure_cache(ttl=cache_ttl)
+    else:
+        db_manager.configure_cache(size=0)
+
+    if socket_path is None:
+        run_lines(file or sys.stdin, sys.stdout)
+        return
+
+    import signal
+    import socketserver
+    import stat
+
+    class Handler(socketserver.StreamRequestHandler):
+
+        def handle(self):
+            lines = (line.decode("utf-8") for line in self.rfile)
+            out = io.TextIOWrapper(self.wfile, encoding="utf-8")
+            run_lines(lines, out)
+            out.detach()
+
+    # * only a socket left by a previous shell is replaced, never a file given by mistake
+    if os.path.lexists(socket_path):
+        if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            raise click.UsageError(f"{socket_path} exists and is not a socket")
+        os.remove(socket_path)
+
+    # * stop cleanly (and remove the socket) on kill, not only on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with socketserver.UnixStreamServer(socket_path, Handler) as server:
+        print(f"Serving on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+
 # ! Entry Point
 # * This is the entry point of the program.
-# * - It first calls the 'create_db' function from 'db_manager' module to create the database if it doesn't exist.
-# * - It then calls the 'create_excel' function from 'db_manager' module to create the Excel file if it doesn't exist.
-# * - Finally, it invokes the 'cli' command-line interface to start the program.
+# * - It invokes the 'cli' command-line interface, which creates a new database or checks
+# *   that an existing one is migrated before running the command.
+# * - The Excel file is no longer created here, 'exportExcel' writes it when it's needed.
 
 
 if __name__ == '__main__':
-    db_manager.create_db()
-    db_manager.create_excel()
     cli()
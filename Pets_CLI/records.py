@@ -0,0 +1,250 @@
+import array  # ? typed arrays to build the columns of a result set
+import itertools  # ? to read the rows in chunks
+
+# ? This module provides the in-memory data model of the rows read from the database.
+# * - `User`, `Pet` and `Category` hold one row with named attributes. They use `__slots__`,
+# *   so instances have no `__dict__` and take about the memory of a tuple.
+# * - `ResultSet` holds many rows column by column: numbers in typed arrays and text as
+# *   integer codes into a list of distinct values, so repeated names, categories and sexes
+# *   are stored once. Filters run on whole columns with numpy instead of row by row.
+# * - numpy is only imported by the `ResultSet` methods, records don't need it.
+# * Records can be shared by the query cache, treat them as read-only.
+
+BATCH = 5000
+
+
+# ? Record
+# * This is the base class of the record classes.
+# * - `from_row(row)` builds a record from a row with the columns of its table, in order.
+# * - Records iterate over their values, so `tuple(record)` gives back the row.
+
+class Record:
+
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def __iter__(self):
+        for name in self.__slots__:
+            yield getattr(self, name)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple(self) == tuple(other)
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+
+# ? User
+# * A row of the 'Users' table: (UserID, Name, Lastname).
+
+class User(Record):
+
+    __slots__ = ("id", "name", "lastname")
+
+    def __init__(self, id, name, lastname):
+        self.id = id
+        self.name = name
+        self.lastname = lastname
+
+
+# ? Pet
+# * A row of the 'Pets' table: (PetID, CategoryID, Name, Sex, UserID, Age).
+
+class Pet(Record):
+
+    __slots__ = ("id", "category_id", "name", "sex", "user_id", "age")
+
+    def __init__(self, id, category_id, name, sex, user_id, age):
+        self.id = id
+        self.category_id = category_id
+        self.name = name
+        self.sex = sex
+        self.user_id = user_id
+        self.age = age
+
+
+# ? Category
+# * A row of the 'Categorys' table: (CategoryID, Name).
+
+class Category(Record):
+
+    __slots__ = ("id", "name")
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+# ? Column Builder
+# * This class collects the values of one column while the rows are read.
+# * - Integer and float columns go to an `array.array` of 8 byte values.
+# * - Any other column is dictionary encoded: each distinct value gets an integer code.
+# * - If a numeric column meets a value that doesn't fit (None, text, ...), it's converted
+# *   to a dictionary encoded column.
+
+class ColumnBuilder:
+
+    __slots__ = ("numbers", "codes", "lookup")
+
+    def __init__(self, first):
+        self.numbers = None
+        self.codes = None
+        self.lookup = None
+
+        if isinstance(first, int) and not isinstance(first, bool):
+            self.numbers = array.array("q")
+        elif isinstance(first, float):
+            self.numbers = array.array("d")
+        else:
+            self.encode(())
+
+    def encode(self, values):
+        self.codes = array.array("i")
+        self.lookup = {}
+        self.extend(values)
+
+    def extend(self, values):
+        if self.numbers is not None:
+            before = len(self.numbers)
+            try:
+                self.numbers.extend(values)
+                return
+            except (TypeError, OverflowError):
+                numbers, self.numbers = self.numbers, None
+                self.encode(numbers[:before].tolist())
+
+        lookup = self.lookup
+        self.codes.extend([lookup.setdefault(value, len(lookup)) for value in values])
+
+    def build(self):
+        import numpy as np
+
+        if self.numbers is not None:
+            return np.frombuffer(self.numbers, dtype=self.numbers.typecode)
+
+        values = np.empty(len(self.lookup), dtype=object)
+        values[:] = list(self.lookup)
+        return np.frombuffer(self.codes, dtype=np.int32), values
+
+
+# ? Result Set
+# * This class holds the rows of a bulk read column by column.
+# ! @param columns - The column names.
+# ! @param data - A dictionary {column: numpy array} for numeric columns, or
+# *               {column: (codes, values)} for dictionary encoded ones.
+# ! @param length - The number of rows.
+# * - `from_rows(rows, columns)` builds it from an iterable of rows, reading them in chunks.
+# * - `rs[column]` returns the column as a numpy array (text columns are decoded).
+# * - `mask(column, *values)` returns a boolean array of the rows whose column is one of
+# *   the values. On text columns it compares the integer codes, not the strings.
+# * - `where(**conditions)` keeps the rows matching every condition, e.g.
+# *   `rs.where(Category="Dogs", Age=[1, 2])`, and `filter(mask)` the rows of any numpy
+# *   mask or index array, e.g. `rs.filter(rs["Age"] > 10)`. Both return a new ResultSet.
+# * - `rows()` yields the rows as tuples and `records(cls)` as records, e.g. `Pet`.
+# * - `nbytes` is the memory of the columns.
+
+class ResultSet:
+
+    __slots__ = ("columns", "_data", "_length")
+
+    def __init__(self, columns, data, length):
+        self.columns = list(columns)
+        self._data = data
+        self._length = length
+
+    @classmethod
+    def from_rows(cls, rows, columns, size=BATCH):
+        rows = iter(rows)
+        builders = None
+        length = 0
+
+        for chunk in iter(lambda: list(itertools.islice(rows, size)), []):
+            if builders is None:
+                builders = [ColumnBuilder(value) for value in chunk[0]]
+            for builder, values in zip(builders, zip(*chunk)):
+                builder.extend(values)
+            length += len(chunk)
+
+        if builders is None:
+            builders = [ColumnBuilder(None) for column in columns]
+
+        return cls(columns, {column: builder.build()
+                             for column, builder in zip(columns, builders)}, length)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, column):
+        data = self._data[column]
+        if isinstance(data, tuple):
+            codes, values = data
+            return values[codes]
+        return data
+
+    def mask(self, column, *values):
+        import numpy as np
+
+        data = self._data[column]
+
+        if isinstance(data, tuple):
+            codes, known = data
+            wanted = [code for code, value in enumerate(known) if value in values]
+            return np.isin(codes, wanted)
+
+        return np.isin(data, values)
+
+    def where(self, **conditions):
+        import numpy as np
+
+        selected = np.ones(self._length, dtype=bool)
+
+        for column, value in conditions.items():
+            values = value if isinstance(value, (list, tuple, set)) else (value,)
+            selected &= self.mask(column, *values)
+
+        return self.filter(selected)
+
+    def filter(self, mask):
+        data = {}
+        length = 0
+
+        for column, values in self._data.items():
+            if isinstance(values, tuple):
+                data[column] = (values[0][mask], values[1])
+                length = len(data[column][0])
+            else:
+                data[column] = values[mask]
+                length = len(data[column])
+
+        return ResultSet(self.columns, data, length)
+
+    def rows(self, size=BATCH):
+        for start in range(0, self._length, size):
+            columns = []
+            for column in self.columns:
+                data = self._data[column]
+                if isinstance(data, tuple):
+                    codes, values = data
+                    columns.append(values[codes[start:start + size]].tolist())
+                else:
+                    columns.append(data[start:start + size].tolist())
+            yield from zip(*columns)
+
+    def records(self, cls):
+        return map(cls.from_row, self.rows())
+
+    @property
+    def nbytes(self):
+        total = 0
+        for data in self._data.values():
+            if isinstance(data, tuple):
+                codes, values = data
+                total += codes.nbytes + values.nbytes
+                total += sum(value.__sizeof__() for value in values)
+            else:
+                total += data.nbytes
+        return total
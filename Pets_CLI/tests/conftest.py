@@ -0,0 +1,53 @@
+import os  # ? to find the project modules
+import sys  # ? to import the project modules
+import pytest  # ? pytest fixtures
+from click.testing import CliRunner  # ? to run the CLI commands in process
+
+# ? Shared fixtures of the tests.
+# * - `db` points db_manager to a new database in a temporary folder, which is also the
+# *   working directory, so the exports and backups are written there.
+# * - `run` runs a CLI command line in process and returns the click result.
+
+PROJECT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT)
+
+import db_manager  # noqa: E402
+import cli  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+
+    monkeypatch.chdir(tmp_path)
+    db_manager.configure(path=str(tmp_path / "data.db"), readonly=False, immutable=False)
+    db_manager.configure_cache(size=db_manager.CACHE_SIZE, ttl=db_manager.CACHE_TTL)
+    db_manager.create_db()
+    yield db_manager
+    db_manager.pool.close()
+    db_manager.cache.clear()
+
+
+@pytest.fixture
+def run(db):
+
+    runner = CliRunner()
+
+    def invoke(*args, input=None):
+        return runner.invoke(cli.cli, [str(arg) for arg in args], input=input)
+
+    return invoke
+
+
+# ? Sample Data
+# * `sample(db)` inserts 2 categorys, 2 users and 3 pets, the pets 1 and 2 belong to user 1.
+
+def sample(db):
+
+    db.bulk_import("Categorys", [{"Name": "Dogs"}, {"Name": "Cats"}])
+    db.bulk_import("Users", [{"Name": "John", "Lastname": "Doe"},
+                             {"Name": "Ana", "Lastname": "Pérez"}])
+    db.bulk_import("Pets", [
+        {"CategoryID": 1, "Name": "Max", "Sex": "Male", "UserID": 1, "Age": 3},
+        {"CategoryID": 2, "Name": "Luna", "Sex": "Female", "UserID": 1, "Age": 5},
+        {"CategoryID": 1, "Name": "Rocky", "Sex": "Male", "UserID": 2, "Age": 2},
+    ])
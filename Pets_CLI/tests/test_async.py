@@ -0,0 +1,57 @@
+import asyncio  # ? to run the coroutines
+import pytest  # ? to check the errors
+import async_db  # ? the async API
+from conftest import sample  # ? sample rows
+
+
+def run_async(coroutine):
+
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await async_db.close()
+
+    return asyncio.run(main())
+
+
+def test_keyword_arguments(db):
+
+    sample(db)
+
+    async def work():
+        page = await async_db.aget_pets(limit=2)
+        pet = await async_db.aget_pet(3)
+        deleted = await async_db.adelete_many("Pets", filters={"UserID": 1})
+        return page, pet, deleted
+
+    page, pet, deleted = run_async(work())
+
+    assert len(page) == 2
+    assert pet.name == "Rocky"
+    assert deleted == 2
+    assert db.user_pets(1) == []
+
+
+def test_failed_write_only_rolls_back_itself(db):
+
+    sample(db)
+
+    async def work():
+        return await asyncio.gather(
+            async_db.acreate_pet(2, 1, "Toby", "Male", 1),
+            async_db.acreate_pet(99, 1, "Ghost", "Male", 1),
+            async_db.anew_user(Name="Bob", Lastname="Ray"),
+            return_exceptions=True)
+
+    created, error, user_id = run_async(work())
+
+    assert isinstance(created, int) and isinstance(user_id, int)
+    assert isinstance(error, db.sql.IntegrityError)
+    assert db.get_user(user_id).name == "Bob"
+
+
+def test_unknown_keyword_fails(db):
+
+    with pytest.raises(TypeError):
+        run_async(async_db.aget_pets(size=2))
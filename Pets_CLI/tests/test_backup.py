@@ -0,0 +1,50 @@
+import pytest  # ? parametrized tests
+from conftest import sample  # ? sample rows
+
+
+def pet_names(db):
+    return sorted(row[0] for row in db.fetch_all("SELECT Name FROM Pets"))
+
+
+@pytest.mark.parametrize("compression", [None, "gzip", "xz"])
+def test_restore_brings_back_the_backup(db, run, compression):
+
+    sample(db)
+    args = ["--compress", compression] if compression else []
+    # * '#', '?' and '%' would end or break an unescaped URI
+    result = run("backup", "--output", "night #1?50%.db", "--pages", 1, "--sleep", 0, *args)
+    assert result.exit_code == 0, result.output
+
+    db.delete_pet(1)
+    db.create_pet(2, 2, "Toby", "Male", 1)
+
+    result = run("restore", "night #1?50%.db", "--yes")
+    assert result.exit_code == 0, result.output
+    assert pet_names(db) == ["Luna", "Max", "Rocky"]
+    assert db.get_pet(1).name == "Max"
+
+
+def test_corrupt_backups_are_rejected(db, run):
+
+    sample(db)
+    with open("broken.db", "wb") as file:
+        file.write(b"SQLite format 3\x00" + b"\x01" * 4096)
+
+    result = run("restore", "broken.db", "--yes")
+
+    assert result.exit_code == 1
+    assert "Can't restore broken.db" in result.output
+    assert pet_names(db) == ["Luna", "Max", "Rocky"]
+
+
+def test_immutable_reads_of_a_backup(db, run, tmp_path):
+
+    sample(db)
+    backup = tmp_path / "copies #1" / "data.db"
+    assert run("backup", "--output", backup).exit_code == 0
+    db.delete_pet(1)
+
+    db.configure(path=str(backup), readonly=True, immutable=True)
+
+    assert pet_names(db) == ["Luna", "Max", "Rocky"]
+    assert run("--immutable", "searchuser", 1).output == "User 1 - John - Doe\n"
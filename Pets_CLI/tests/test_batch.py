@@ -0,0 +1,58 @@
+from conftest import sample  # ? sample rows
+
+
+def pets_of(db, user_id):
+    return sorted(row[0] for row in db.fetch_all(
+        "SELECT PetID FROM Pets WHERE UserID=?", (user_id,)))
+
+
+def test_delete_by_ids_and_file(db, run, tmp_path):
+
+    sample(db)
+    (tmp_path / "ids.txt").write_text("2,\n3\n")
+
+    result = run("deletepets", 1, "--ids-file", "ids.txt", "--where", "UserID=1")
+
+    assert result.output == "2 pets deleted\n"
+    assert pets_of(db, 1) == []
+    assert pets_of(db, 2) == [3]
+
+
+def test_delete_users_cascades_to_their_pets(db, run):
+
+    sample(db)
+
+    assert run("deleteusers", 1).output == "1 users deleted\n"
+    assert db.get_user(1) is None
+    assert pets_of(db, 1) == []
+    assert db.get_pet(1) is None
+
+
+def test_failed_batches_change_nothing(db, run):
+
+    sample(db)
+
+    result = run("deletecategorys", 1, 2)
+    assert result.exit_code == 2
+    assert "nothing was deleted" in result.output
+
+    result = run("updatepets", "--set", "CategoryID=9", "--where", "UserID=1")
+    assert result.exit_code == 2
+    assert "nothing was updated" in result.output
+
+    assert run("updatepets", "--set", "PetID=9", 1).exit_code == 2
+    assert run("updatepets", "--set", "Color=red", 1).exit_code == 2
+    assert run("deletepets").exit_code == 2
+    assert [pet.category_id for pet in map(db.get_pet, (1, 2, 3))] == [1, 2, 1]
+
+
+def test_updates_span_batches_and_refresh_the_cache(db):
+
+    sample(db)
+    assert db.get_pet(1).age == 3
+
+    count = db.update_many("Pets", {"Age": "7"}, ids=[1, 2, 3], batch_size=2)
+
+    assert count == 3
+    assert [db.get_pet(id).age for id in (1, 2, 3)] == [7, 7, 7]
+    assert db.delete_many("Pets", ids=[1, 2, 3, 4], batch_size=2) == 3
@@ -0,0 +1,71 @@
+import json  # ? to read the shell results
+import sqlite3  # ? to write like another process
+import threading  # ? to write while a read runs
+from conftest import sample  # ? sample rows
+
+
+def test_keyword_calls(db):
+
+    sample(db)
+
+    assert db.get_pet(id=1).name == "Max"
+    assert db.get_user(ID=2).lastname == "Pérez"
+    assert db.get_category(id=2).name == "Cats"
+
+    db.update_pet(1, 1, "Maximus", "Male", 1, 4)
+    assert db.get_pet(id=1).name == "Maximus"
+
+
+def test_writes_invalidate_listings_and_rows(db):
+
+    sample(db)
+    assert len(db.user_pets(1)) == 2
+    assert db.get_user(1).name == "John"
+
+    db.create_pet(1, 1, "Toby", "Male", 1)
+    db.update_user(1, "Johnny", "Doe")
+
+    assert len(db.user_pets(1)) == 3
+    assert db.get_user(1).name == "Johnny"
+
+
+def test_read_racing_a_commit_is_not_cached(db):
+
+    sample(db)
+
+    @db.cached(row="Users")
+    def racing_user(ID):
+        user = db.get_user.uncached(ID)
+        writer = threading.Thread(target=db.update_user, args=(ID, "Zed", "Doe"))
+        writer.start()
+        writer.join()
+        return user
+
+    assert racing_user(1).name == "John"
+    assert racing_user(1).name == "Zed"
+
+
+def test_update_reads_current_values(run, db):
+
+    sample(db)
+    assert db.get_user(1).name == "John"
+
+    other = sqlite3.connect(db.pool.path)
+    other.execute("UPDATE Users SET Name='Zed' WHERE UserID=1")
+    other.commit()
+    other.close()
+
+    result = run("updateuser", 1, "--lastname", "Lopez")
+
+    assert result.exit_code == 0, result.output
+    assert tuple(db.get_user.uncached(1)) == (1, "Zed", "Lopez")
+
+
+def test_shell_cache_ttl(run, db):
+
+    sample(db)
+    result = run("shell", "--cache-ttl", 0, input="searchuser 1\nsearchuser 1\n")
+
+    lines = [json.loads(line) for line in result.output.splitlines()]
+    assert [line["ok"] for line in lines] == [True, True]
+    assert db.cache_stats()["size"] == 0
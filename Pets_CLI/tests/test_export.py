@@ -0,0 +1,119 @@
+import gc  # ? to collect the workbook of the failed export
+import os  # ? to check the export files
+import pytest  # ? to mark the tests
+from openpyxl import load_workbook  # ? to read the Excel exports
+from conftest import sample  # ? sample rows
+
+
+def sheet_rows(path, sheet):
+    return sorted(load_workbook(path)[sheet].iter_rows(min_row=2, values_only=True))
+
+
+def log_size(db):
+    return db.fetch_one("SELECT COUNT(*) FROM ChangeLog")[0]
+
+
+def test_no_log_without_export_targets(db):
+
+    sample(db)
+    db.new_user("Bob", "Ray")
+    db.update_pet(1, 1, "Max", "Male", 2, 4)
+
+    assert log_size(db) == 0
+
+
+def test_incremental_excel_matches_full_export(db, tmp_path):
+
+    sample(db)
+    db.export_excel("data.xlsx")
+    assert log_size(db) == 0
+
+    db.new_user("Bob", "Ray")
+    db.update_pet(1, 1, "Max", "Male", 2, 4)
+    db.delete_pet(3)
+    assert log_size(db) > 0
+
+    db.export_excel("data.xlsx", incremental=True)
+    db.export_excel("full.xlsx")
+
+    for sheet in ("Users", "Pets", "Categories"):
+        assert sheet_rows("data.xlsx", sheet) == sheet_rows("full.xlsx", sheet)
+    assert log_size(db) == 0
+
+
+def test_log_kept_for_the_oldest_target(db):
+
+    sample(db)
+    db.export_excel("a.xlsx")
+    db.export_excel("b.xlsx")
+    db.new_user("Bob", "Ray")
+    db.export_excel("a.xlsx", incremental=True)
+
+    assert log_size(db) == 1
+    db.export_excel("b.xlsx", incremental=True)
+    assert log_size(db) == 0
+    assert ("Bob", "Ray") in [row[1:] for row in sheet_rows("b.xlsx", "Users")]
+
+
+def test_stale_targets_expire(db):
+
+    sample(db)
+    db.export_excel("once.xlsx")
+    db.bulk_import("Users", [{"Name": f"N{i}", "Lastname": "L"} for i in range(100)])
+    assert log_size(db) == 100
+
+    with db.pool.connection() as con:
+        con.execute("UPDATE ExportState SET ExportedAt = datetime('now', '-8 days')")
+    db.prune_change_log()
+
+    assert log_size(db) == 0
+    assert db.fetch_one("SELECT COUNT(*) FROM ExportState")[0] == 0
+    db.new_user("Bob", "Ray")
+    assert log_size(db) == 0
+
+
+# * openpyxl warns about the unfinished sheets of the workbook it couldn't save
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnraisableExceptionWarning")
+def test_failed_first_export_is_forgotten(db, tmp_path):
+
+    sample(db)
+    with pytest.raises(OSError):
+        db.export_excel(str(tmp_path / "missing" / "data.xlsx"))
+    gc.collect()
+
+    assert db.fetch_one("SELECT COUNT(*) FROM ExportState")[0] == 0
+    assert not os.path.exists(tmp_path / "missing")
+
+
+def test_pdf_tables_are_created_while_building(db, monkeypatch, tmp_path):
+
+    sample(db)
+    db.bulk_import("Pets", ({"CategoryID": 1, "Name": f"Pet{i}", "Sex": "Male",
+                             "UserID": 1, "Age": 1} for i in range(300)))
+    longest = []
+
+    class Stream(db.FlowableStream):
+        def append(self, flowable):
+            super().append(flowable)
+            longest.append(len(self))
+
+    monkeypatch.setattr(db, "FlowableStream", Stream)
+    db.export_pdf("tables.pdf", rows_per_table=10)
+
+    assert len(longest) == 1 + 31 + 1
+    assert max(longest) == 8
+
+    # * the same pages as a story built up front
+    monkeypatch.setattr(db, "FlowableStream", list)
+    db.export_pdf("listed.pdf", rows_per_table=10)
+
+    def pages(name):
+        return (tmp_path / name).read_bytes().count(b"/Type /Page\n")
+    assert pages("tables.pdf") == pages("listed.pdf") > 1
+
+
+def test_pdf_checks_the_columns_first(db, tmp_path):
+
+    with pytest.raises(ValueError, match="no column Color"):
+        db.export_pdf("tables.pdf", sections=["Users", "Pets"], columns=["Name", "Color"])
+    assert not (tmp_path / "tables.pdf").exists()
@@ -0,0 +1,76 @@
+import json  # ? to write the JSONL files
+from openpyxl import Workbook  # ? to write the Excel files
+from conftest import sample  # ? sample rows
+
+
+def test_bulk_import_counts_invalid_rows(db):
+
+    result = db.bulk_import("Users", [
+        {"Name": "John", "Lastname": "Doe"},
+        {"Name": "Ana"},
+        {"UserID": "x", "Name": "Bob", "Lastname": "Ray"},
+    ])
+
+    assert (result["inserted"], result["rejected"]) == (1, 2)
+    assert [name for id, name, lastname in db.get_users()] == ["John"]
+
+
+def test_bulk_import_rejects_broken_foreign_keys(db):
+
+    sample(db)
+    result = db.bulk_import("Pets", [
+        {"CategoryID": 1, "Name": "Toby", "Sex": "Male", "UserID": 2, "Age": 1},
+        {"CategoryID": 1, "Name": "Ghost", "Sex": "Male", "UserID": 99, "Age": 1},
+    ])
+
+    assert (result["inserted"], result["rejected"]) == (1, 1)
+
+
+def test_jsonl_bad_lines_are_rejected(run, tmp_path):
+
+    path = tmp_path / "users.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"Name": "John", "Lastname": "Doe"}),
+        "{not json",
+        json.dumps(["a", "list"]),
+        "",
+        json.dumps({"Name": "Ana", "Lastname": "Pérez"}),
+    ]), encoding="utf-8")
+
+    result = run("import", path, "--table", "users")
+
+    assert result.exit_code == 0, result.output
+    assert "2 rows imported, 2 rejected" in result.output
+
+
+def test_csv_with_byte_order_mark(run, tmp_path, db):
+
+    # * Excel's "CSV UTF-8" starts the file with a BOM
+    path = tmp_path / "users.csv"
+    path.write_text("Name,Lastname\nJohn,Doe\nAna,Pérez\n", encoding="utf-8-sig")
+
+    result = run("import", path, "--table", "users")
+
+    assert result.exit_code == 0, result.output
+    assert "2 rows imported, 0 rejected" in result.output
+    assert run("import", path, "--table", "users", "--batch-size", 0).exit_code == 2
+
+
+def test_xlsx_missing_sheets_fail(run, tmp_path, db):
+
+    book = Workbook()
+    book.active.title = "Users"
+    book.active.append(["Name", "Lastname"])
+    book.active.append(["John", "Doe"])
+    path = tmp_path / "data.xlsx"
+    book.save(path)
+
+    result = run("import", path)
+
+    assert result.exit_code == 2
+    assert "Missing sheets" in result.output
+    assert "Categories, Pets" in result.output
+    assert db.get_users() == []
+
+    result = run("import", path, "--table", "users")
+    assert "1 rows imported" in result.output
@@ -0,0 +1,93 @@
+import sqlite3  # ? to write a database of an older version
+import pytest  # ? fixtures and expected errors
+from click.testing import CliRunner  # ? to run the CLI commands in process
+from conftest import cli, db_manager  # ? the project modules
+
+# * the schema before the migrations, the pets table has no foreign keys
+OLD_SCHEMA = """
+CREATE TABLE "Users" ("UserID" INTEGER, "Name" TEXT, "Lastname" TEXT,
+    PRIMARY KEY("UserID" AUTOINCREMENT));
+CREATE TABLE "Categorys" ("CategoryID" INTEGER, "Name" TEXT,
+    PRIMARY KEY("CategoryID" AUTOINCREMENT));
+CREATE TABLE "Pets" ("PetID" INTEGER, "CategoryID" INTEGER, "Name" TEXT, "Sex" TEXT,
+    "UserID" INTEGER, "Age" INTEGER, PRIMARY KEY("PetID" AUTOINCREMENT));
+INSERT INTO Users(Name, Lastname) VALUES ('John', 'Doe');
+INSERT INTO Categorys(Name) VALUES ('Dogs');
+INSERT INTO Pets(CategoryID, Name, Sex, UserID, Age)
+    VALUES (1, 'Max', 'Male', 1, 3), (1, 'Ghost', 'Male', 7, 2);
+"""
+
+LATEST = db_manager.MIGRATIONS[-1][0]
+
+
+@pytest.fixture
+def path(tmp_path, monkeypatch):
+
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "data.db"
+    db_manager.configure(path=str(path), readonly=False, immutable=False)
+    yield path
+    db_manager.pool.close()
+    db_manager.cache.clear()
+
+
+@pytest.fixture
+def old_db(path):
+
+    with sqlite3.connect(path) as con:
+        con.executescript(OLD_SCHEMA)
+    con.close()
+    return path
+
+
+def invoke(*args):
+    return CliRunner().invoke(cli.cli, list(args))
+
+
+def pet_count():
+    return db_manager.fetch_one("SELECT COUNT(*) FROM Pets")[0]
+
+
+def test_new_database_is_created(path):
+
+    result = invoke("users")
+
+    assert result.exit_code == 0, result.output
+    assert db_manager.schema_version() == LATEST
+
+
+def test_commands_dont_migrate_existing_databases(old_db):
+
+    result = invoke("users")
+
+    assert result.exit_code == 2
+    assert "run 'migrate'" in result.output
+    assert db_manager.schema_version() == 0
+
+
+def test_migrations_keep_orphans_until_repair(old_db):
+
+    result = invoke("migrate")
+    assert result.exit_code == 1
+    assert "Migration 5 failed: 1 pets have no user or category" in result.output
+    assert db_manager.schema_version() == 4
+    assert pet_count() == 2
+
+    result = invoke("repair", "--no-vacuum")
+    assert result.exit_code == 0, result.output
+    assert "1 orphaned pets removed" in result.output
+
+    result = invoke("migrate")
+    assert result.exit_code == 0, result.output
+    assert f"The database is at version {LATEST}" in result.output
+    assert pet_count() == 1
+    assert invoke("searchuser", "1").output == "User 1 - John - Doe\n"
+
+
+def test_search_index_needs_fts5(path, monkeypatch):
+
+    monkeypatch.setattr(db_manager, "create_search_index", lambda: False)
+
+    with pytest.raises(db_manager.sql.OperationalError, match="FTS5"):
+        db_manager.migrate()
+    assert db_manager.schema_version() == 3
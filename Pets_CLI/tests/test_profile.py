@@ -0,0 +1,37 @@
+import pytest  # ? parametrized tests
+from conftest import sample  # ? sample rows
+
+
+def profiled_queries(run, *args):
+
+    result = run("--profile", "summary", "--profile-output", "profile.txt", *args)
+    assert result.exit_code == 0, result.output
+
+    with open("profile.txt", encoding="utf-8") as file:
+        lines = file.read().split("Queries", 1)[1].splitlines()[1:]
+    return [line.strip() for line in lines if not line.strip().startswith("plan:")]
+
+
+@pytest.mark.parametrize("command, query", [
+    ("exportexcel", "SELECT PetID, CategoryID, Name, Sex, UserID, Age"),
+    ("exportpdf", "SELECT * FROM ( SELECT p.PetID"),
+    ("stats", "SELECT Sex, COUNT(*) FROM Pets GROUP BY Sex"),
+])
+def test_reports_list_their_queries(db, run, command, query):
+
+    sample(db)
+
+    queries = profiled_queries(run, command)
+
+    assert any(line.startswith(query) for line in queries), queries
+
+
+def test_incremental_export_lists_the_changed_rows(db, run):
+
+    sample(db)
+    assert run("exportexcel").exit_code == 0
+    db.update_pet(1, 1, "Maximus", "Male", 1, 4)
+
+    queries = profiled_queries(run, "exportexcel", "--incremental")
+
+    assert any(line.startswith("SELECT TableName, RowID") for line in queries), queries
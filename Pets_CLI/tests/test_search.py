@@ -0,0 +1,62 @@
+import pytest  # ? parametrized tests
+from conftest import sample  # ? sample rows
+
+
+def pet_names(db, text):
+    return [row[1] for row in db.search_pets(text)]
+
+
+def search_triggers(db):
+    return {row[0] for row in db.fetch_all(
+        "SELECT name FROM sqlite_master WHERE type='trigger' AND name LIKE 'search_%'")}
+
+
+def test_search_follows_writes(db):
+
+    sample(db)
+    assert pet_names(db, "max") == ["Max"]
+
+    db.update_pet(1, 1, "Maximus", "Male", 2, 4)
+    db.update_many("Pets", {"Age": 9}, filters={"UserID": 2})
+    db.delete_pet(2)
+
+    assert pet_names(db, "max") == ["Maximus"]
+    assert pet_names(db, "luna") == []
+    assert [row[0] for row in db.search_users("pere")] == [2]
+    assert db.fetch_one("INSERT INTO PetsSearch(PetsSearch) VALUES ('integrity-check')") is None
+
+
+def test_update_trigger_only_watches_the_names(db):
+
+    sql = db.fetch_one(
+        "SELECT sql FROM sqlite_master WHERE name='search_Pets_update'")[0]
+    assert "AFTER UPDATE OF PetID, Name" in sql
+
+
+def test_large_import_rebuilds_the_index_once(db, monkeypatch):
+
+    sample(db)
+    monkeypatch.setattr(db, "REINDEX_ROWS", 100)
+    triggers = search_triggers(db)
+
+    result = db.bulk_import("Pets", (
+        {"CategoryID": 1, "Name": f"Bulk{i}", "Sex": "Male", "UserID": 1, "Age": 1}
+        for i in range(500)), batch_size=50)
+
+    assert result["inserted"] == 500
+    assert search_triggers(db) == triggers
+    assert len(db.search_pets("bulk", limit=1000)) == 500
+    assert pet_names(db, "rocky") == ["Rocky"]
+
+
+@pytest.mark.parametrize("vacuum", [False, True])
+def test_repair_restores_suspended_triggers(db, vacuum):
+
+    sample(db)
+    assert db.suspend_search("Pets") == "PetsSearch"
+    db.create_pet(2, 1, "Toby", "Male", 1)
+    assert pet_names(db, "toby") == []
+
+    assert db.repair_db(vacuum=vacuum)["search"] == ["PetsSearch"]
+    assert pet_names(db, "toby") == ["Toby"]
+    assert db.repair_db(vacuum=vacuum)["search"] == []
@@ -0,0 +1,53 @@
+import json  # ? to read the shell results
+import os  # ? to find cli.py
+import subprocess  # ? to run the shell in a new process
+import sys  # ? to run the same Python
+from conftest import PROJECT, sample  # ? the project folder and sample rows
+
+
+def shell(run, text):
+
+    result = run("shell", input=text)
+    assert result.exit_code == 0, result.output
+    return [json.loads(line) for line in result.output.splitlines()]
+
+
+def test_commands_dont_read_the_next_lines(db, run):
+
+    sample(db)
+
+    results = shell(run, "deletepets --ids-file -\n3\nsearchuser 1\n")
+
+    assert [result["command"] for result in results] == [
+        "deletepets --ids-file -", "3", "searchuser 1"]
+    assert not results[0]["ok"]
+    assert not results[1]["ok"]
+    assert results[2]["output"] == "User 1 - John - Doe\n"
+    assert db.get_pet(3) is not None
+
+
+def test_prompts_abort_instead_of_reading_commands(db, run, tmp_path):
+
+    sample(db)
+    assert run("backup", "--output", "copy.db").exit_code == 0
+
+    # * a new process, the CliRunner answers the prompts itself instead of reading stdin
+    process = subprocess.run(
+        [sys.executable, os.path.join(PROJECT, "cli.py"), "shell"], cwd=tmp_path,
+        input="restore copy.db\ndeletepet 3\n", capture_output=True, text=True, check=True)
+    results = [json.loads(line) for line in process.stdout.splitlines()]
+
+    assert not results[0]["ok"]
+    assert results[0]["error"] == "Aborted, commands in the shell can't read input"
+    assert results[1]["ok"]
+    assert db.get_pet.uncached(3) is None
+
+
+def test_socket_never_replaces_a_file(db, run, tmp_path):
+
+    result = run("shell", "--socket", "data.db")
+
+    assert result.exit_code == 2
+    assert "data.db exists and is not a socket" in result.output
+    assert (tmp_path / "data.db").exists()
+    assert db.get_users() == []
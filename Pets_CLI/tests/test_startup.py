@@ -0,0 +1,40 @@
+import os  # ? to read the budget and find cli.py
+import subprocess  # ? to start the CLI in a new process
+import sys  # ? to run the same Python
+from conftest import PROJECT  # ? the project folder
+
+# ? Startup Budget
+# * A command that doesn't list or export data must not import the heavy libraries, and
+# * its imports must fit in the budget (PETS_STARTUP_BUDGET_MS, by default 250 ms).
+
+# * urllib.request pulls in http.client, ssl and email, about 37 ms
+HEAVY_MODULES = {"pandas", "numpy", "openpyxl", "reportlab", "pyarrow", "urllib.request"}
+
+BUDGET_MS = float(os.environ.get("PETS_STARTUP_BUDGET_MS", 250))
+
+
+def import_times(*args, cwd):
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(PROJECT, "cli.py"), *args],
+        cwd=cwd, capture_output=True, text=True, check=True)
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(cumulative_us), not name[1:].startswith(" "))
+    return modules
+
+
+def test_deletepet_startup(tmp_path):
+
+    modules = import_times("deletepet", "1", cwd=tmp_path)
+
+    heavy = {name for name in modules
+             if name in HEAVY_MODULES or name.split(".")[0] in HEAVY_MODULES}
+    assert not heavy
+
+    total_ms = sum(cumulative for cumulative, top in modules.values() if top) / 1000
+    assert total_ms < BUDGET_MS